@@ -0,0 +1,437 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+import argparse
+import contextlib
+import csv
+from itertools import product
+import json
+import os
+from pathlib import Path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+STAGES = ['load', 'trie', 'ttl', 'bundle', 'upload']
+STYLES = ['index', 'flat']
+STUB_REGISTRY = 'http://registry.invalid'
+TREE_LEVEL = 'earth-system-discipline'
+
+
+def fanout_for(nodes: int, depth: int) -> int:
+    """
+    Smallest fan-out for a tree of the given depth to reach a number of
+    nodes
+
+    :param nodes: target number of Level 7+ nodes
+    :param depth: number of Level 7+ levels
+
+    :returns: `int` of the fan-out
+    """
+
+    fanout = 2
+    while sum(fanout ** k for k in range(1, depth + 1)) < nodes:
+        fanout += 1
+
+    return fanout
+
+
+def write_index(csv_dir: Path, names: list[str], prefix: str) -> None:
+    csv_dir.mkdir(parents=True, exist_ok=True)
+    with (csv_dir / 'index.csv').open('w', encoding='utf-8',
+                                      newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(['Name', 'Description', 'Source', 'Status'])
+        for name in names:
+            writer.writerow([name, f'Synthetic topic {prefix}{name}', '',
+                             'Operational'])
+
+
+def write_flat_index(csv_dir: Path, names: list[str], depth: int) -> None:
+    columns = [f'level{k}' for k in range(depth)]
+    csv_dir.mkdir(parents=True, exist_ok=True)
+    with (csv_dir / 'index-flat.csv').open('w', encoding='utf-8',
+                                           newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(columns +
+                        [f'{c}-description' for c in columns] + ['Status'])
+        for row in product(names, repeat=depth):
+            writer.writerow(list(row) +
+                            [f'Synthetic {"/".join(row[:k + 1])}'
+                             for k in range(depth)] + ['Operational'])
+
+
+def generate_hierarchy(root_path: Path, target_path: Path, depth: int,
+                       fanout: int, style: str) -> dict:
+    """
+    Generate a synthetic repository checkout: the levels and level 1-6
+    codelists of the actual repository, with a synthetic
+    earth-system-discipline tree
+
+    With the `index` style, every register of the tree has an `index.csv`
+    file; with the `flat` style, only the top level does and each of its
+    registers has an `index-flat.csv` file with the levels below.
+
+    :param root_path: root of the actual repository
+    :param target_path: directory to generate the checkout in
+    :param depth: number of Level 7+ levels
+    :param fanout: number of children of every register
+    :param style: `index` or `flat`
+
+    :returns: `dict` of the number of nodes and CSV files generated
+    """
+
+    if style not in STYLES:
+        raise ValueError(f'Unknown style {style}')
+    if style == 'flat' and depth < 2:
+        raise ValueError('Flat style requires a depth of at least 2')
+
+    csv_dir = target_path / 'topic-hierarchy'
+    csv_dir.mkdir(parents=True)
+    shutil.copy(root_path / 'topic-hierarchy.csv', target_path)
+    csv_files = 1
+
+    for codelist in (root_path / 'topic-hierarchy').glob('*.csv'):
+        if codelist.stem != TREE_LEVEL:
+            shutil.copy(codelist, csv_dir)
+            csv_files += 1
+
+    names = [f'n{i}' for i in range(fanout)]
+    tree_dir = csv_dir / TREE_LEVEL
+
+    def write_tree(directory: Path, prefix: str, level: int) -> int:
+        write_index(directory, names, prefix)
+        files = 1
+        for name in names:
+            if style == 'flat':
+                write_flat_index(directory / name, names, depth - 1)
+                files += 1
+            elif level < depth:
+                files += write_tree(directory / name, f'{prefix}{name}/',
+                                    level + 1)
+        return files
+
+    csv_files += write_tree(tree_dir, '', 1)
+
+    return {
+        'nodes': sum(fanout ** k for k in range(1, depth + 1)),
+        'csv_files': csv_files
+    }
+
+
+class StubResponse:
+    """Minimal HTTP response of the stub registry"""
+
+    def __init__(self, status_code: int, text: str = '') -> None:
+        self.status_code = status_code
+        self.reason = 'OK' if status_code < 400 else 'Not Found'
+        self.text = text
+        self.content = text.encode('utf-8')
+
+
+class StubSession:
+    """
+    In-process stand-in for an authenticated registry session, holding
+    every entry of a TTL directory as already published
+
+    Entries are served as generated, so that a dry run compares every
+    entry and finds it unchanged, as on a routine upload.
+    """
+
+    def __init__(self, base_url: str, root_path: Path) -> None:
+        """
+        Initialize the stub
+
+        :param base_url: base URL the uploader is pointed at
+        :param root_path: directory containing the `wis` TTL directory
+
+        :returns: `None`
+        """
+
+        self.base_url = base_url
+        self.root_path = root_path
+        self.requests = {}
+
+    def _count(self, method: str) -> None:
+        self.requests[method] = self.requests.get(method, 0) + 1
+
+    def get(self, url: str, **kwargs) -> StubResponse:
+        from upload_changes import PUBLIC_ID_PREFIX
+
+        self._count('GET')
+        rel_id = url[len(self.base_url) + 1:].rstrip('/')
+        filepath = self.root_path / f'{rel_id}.ttl'
+        if not filepath.exists():
+            return StubResponse(404)
+
+        # the registry serves entries with absolute IRIs
+        name = rel_id.rsplit('/', 1)[-1]
+        ttl = filepath.read_text(encoding='utf-8').replace(
+            f'<{name}>', f'<{PUBLIC_ID_PREFIX}/{rel_id}>')
+        return StubResponse(200, ttl)
+
+    def post(self, url: str, **kwargs) -> StubResponse:
+        self._count('POST')
+        return StubResponse(201)
+
+    def put(self, url: str, **kwargs) -> StubResponse:
+        self._count('PUT')
+        return StubResponse(204)
+
+
+def run_stage(stage: str, root_path: Path, workers: int) -> dict:
+    """
+    Run an in-process stage, with all output discarded
+
+    :param stage: `load`, `trie` or `upload`
+    :param root_path: root of the (synthetic) repository
+    :param workers: number of concurrent uploads
+
+    :returns: `dict` of the counters of the stage
+    """
+
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        if stage == 'load':
+            import hierarchy
+            model = hierarchy.load(root_path)
+            return {'nodes': sum(1 for _ in model.root.walk()),
+                    'csv_files': len(model.sources)}
+        elif stage == 'trie':
+            import topic_trie
+            trie = topic_trie.load(root_path)
+            return {'paths': len(trie.paths)}
+        elif stage == 'upload':
+            import upload_changes
+            session = StubSession(STUB_REGISTRY, root_path)
+            # relative to the root, as upload_changes.py is run, so that
+            # the entry URLs are the ones of a real upload
+            os.chdir(root_path)
+            failed = upload_changes.upload(
+                session, STUB_REGISTRY, Path('wis'), True, False,
+                'experimental', workers)
+            return {'requests': session.requests, 'failed': failed}
+
+    raise ValueError(f'Unknown stage {stage}')
+
+
+def measure(command: list[str], root_path: Path) -> dict:
+    """
+    Run a command in a child process and measure it
+
+    :param command: command line
+    :param root_path: working directory of the command
+
+    :returns: `dict` of wall time and CPU time (seconds), peak RSS (KiB,
+              including the processes it waited for) and, if the command
+              prints a JSON object, its counters
+    """
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=root_path,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    stdout, stderr = process.stdout.read(), process.stderr.read()
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if process.returncode != 0:
+        raise RuntimeError(f'{" ".join(command)} failed: '
+                           f'{stderr.decode("utf-8")}')
+
+    result = {
+        'wall_time': round(wall_time, 3),
+        'cpu_time': round(rusage.ru_utime + rusage.ru_stime, 3),
+        'peak_rss': rusage.ru_maxrss
+    }
+    if stdout.startswith(b'{'):
+        result.update(json.loads(stdout))
+
+    return result
+
+
+def benchmark(root_path: Path, work_path: Path, nodes: int, depth: int,
+              style: str, stages: list[str], jobs: int,
+              workers: int) -> dict:
+    """
+    Benchmark the pipeline stages on a synthetic hierarchy
+
+    :param root_path: root of the actual repository
+    :param work_path: directory to generate the synthetic checkout in
+    :param nodes: target number of Level 7+ nodes
+    :param depth: number of Level 7+ levels
+    :param style: `index` or `flat`
+    :param stages: stages to run, in pipeline order
+    :param jobs: number of TTL generation processes
+    :param workers: number of concurrent uploads
+
+    :returns: `dict` of the hierarchy generated and of the results of
+              each stage
+    """
+
+    fanout = fanout_for(nodes, depth)
+    print(f'Generating {style} hierarchy of depth {depth} and fan-out '
+          f'{fanout} in {work_path}')
+    result = generate_hierarchy(root_path, work_path, depth, fanout, style)
+    result.update({'style': style, 'depth': depth, 'fanout': fanout,
+                   'stages': {}})
+
+    python = sys.executable
+    for stage in stages:
+        if stage == 'ttl':
+            command = [python, str(SCRIPTS_DIR / 'codelists2ttl.py'),
+                       '--jobs', str(jobs)]
+        elif stage == 'bundle':
+            command = [python, str(SCRIPTS_DIR / 'generate-bundle.py')]
+        else:
+            command = [python, str(Path(__file__).resolve()), 'stage',
+                       stage, '--workers', str(workers)]
+
+        stage_result = measure(command, work_path)
+        if stage == 'ttl':
+            stage_result['files'] = sum(
+                1 for _ in (work_path / 'wis').rglob('*.ttl'))
+        elif stage == 'bundle':
+            stage_result['files'] = sum(
+                1 for f in (work_path / 'topic-hierarchy').iterdir()
+                if f.stem in ('topic-hierarchy', TREE_LEVEL))
+
+        print(f'  {stage}: {stage_result}')
+        result['stages'][stage] = stage_result
+
+    return result
+
+
+def compare(results: list[dict], baseline: dict, threshold: float) -> int:
+    """
+    Compare the wall times of stages with a baseline report
+
+    :param results: results of `benchmark`
+    :param baseline: previous report
+    :param threshold: ratio of wall times above which a stage regressed
+
+    :returns: `int` of regressed stages
+    """
+
+    previous = {(r['nodes'], r['style']): r for r in baseline['results']}
+    regressions = 0
+
+    for result in results:
+        key = (result['nodes'], result['style'])
+        if key not in previous:
+            continue
+        for stage, stage_result in result['stages'].items():
+            before = previous[key]['stages'].get(stage)
+            if before is None or not before['wall_time']:
+                continue
+            ratio = stage_result['wall_time'] / before['wall_time']
+            regressed = ratio > threshold
+            regressions += regressed
+            print(f'{key[1]} {key[0]} {stage}: {before["wall_time"]}s -> '
+                  f'{stage_result["wall_time"]}s ({ratio:.2f}x)'
+                  f'{" REGRESSION" if regressed else ""}')
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser(
+        'run', help='Benchmark the pipeline on synthetic hierarchies')
+    run_parser.add_argument('-r', '--root', default='.', type=Path,
+                            help='Root of the wis2-topic-hierarchy repository')
+    run_parser.add_argument('-n', '--nodes', type=int, nargs='+',
+                            default=[1000, 10000],
+                            help='Target numbers of Level 7+ nodes')
+    run_parser.add_argument('-d', '--depth', type=int, default=4,
+                            help='Number of Level 7+ levels')
+    run_parser.add_argument('--style', choices=STYLES, nargs='+',
+                            default=STYLES,
+                            help='CSV layouts of the synthetic trees')
+    run_parser.add_argument('--stages', choices=STAGES, nargs='+',
+                            default=STAGES, help='Stages to run')
+    run_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='Number of TTL generation processes')
+    run_parser.add_argument('-w', '--workers', type=int, default=4,
+                            help='Number of concurrent uploads')
+    run_parser.add_argument('-o', '--output', type=Path,
+                            help='File to write the JSON report to')
+    run_parser.add_argument('-b', '--baseline', type=Path,
+                            help='JSON report to compare wall times with')
+    run_parser.add_argument('-t', '--threshold', type=float, default=1.25,
+                            help='Wall time ratio flagged as a regression')
+    run_parser.add_argument('--keep', action='store_true',
+                            help='Keep the synthetic checkouts')
+
+    stage_parser = subparsers.add_parser(
+        'stage', help='Run one in-process stage (used by run)')
+    stage_parser.add_argument('stage', choices=['load', 'trie', 'upload'])
+    stage_parser.add_argument('-w', '--workers', type=int, default=4)
+
+    args = parser.parse_args()
+
+    if args.command == 'stage':
+        print(json.dumps(run_stage(args.stage, Path.cwd(), args.workers)))
+        sys.exit(0)
+
+    # stages are always run in pipeline order, as each needs the previous
+    stages = [stage for stage in STAGES if stage in args.stages]
+    if 'upload' in stages and 'ttl' not in stages:
+        parser.error('The upload stage requires the ttl stage')
+    results = []
+
+    for nodes in args.nodes:
+        for style in args.style:
+            work_path = Path(tempfile.mkdtemp(prefix='wth-benchmark-'))
+            try:
+                results.append(benchmark(
+                    args.root.resolve(), work_path, nodes, args.depth,
+                    style, stages, args.jobs, args.workers))
+            finally:
+                if not args.keep:
+                    shutil.rmtree(work_path)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results
+    }
+
+    if args.output is not None:
+        with args.output.open('w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=1)
+
+    if args.baseline is not None:
+        with args.baseline.open(encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
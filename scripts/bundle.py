@@ -0,0 +1,269 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+import csv
+from itertools import chain
+import json
+from pathlib import Path
+import sqlite3
+from typing import Iterator
+
+from hierarchy import CSV_DIR, TREE_LEVEL, Hierarchy, Node
+import instrumentation
+from topic_snapshot import SNAPSHOT_FILE, write_snapshot
+
+# outputs of the bundle, relative to the root of the repository
+TOPICS_CSV = f'{CSV_DIR}/{TREE_LEVEL}.csv'
+SQLITE_FILE = f'{CSV_DIR}/topic-hierarchy.sqlite'
+JSON_FILE = f'{CSV_DIR}/topic-hierarchy.json'
+OUTPUTS = [TOPICS_CSV, SQLITE_FILE, JSON_FILE, SNAPSHOT_FILE]
+
+SCHEMA = '''
+CREATE TABLE levels (
+    level INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT
+);
+CREATE TABLE topics (
+    id INTEGER PRIMARY KEY,
+    level INTEGER NOT NULL REFERENCES levels (level),
+    level_name TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT,
+    description TEXT,
+    source TEXT,
+    status TEXT,
+    leaf INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX topics_path ON topics (level_name, path);
+CREATE INDEX topics_parent ON topics (level_name, parent);
+CREATE INDEX topics_status ON topics (status);
+'''
+
+
+def subtree_rows(number: int, level_name: str, node: Node,
+                 path: str = '') -> Iterator[tuple]:
+    """
+    Generate the rows of the topics table of a node and its descendants
+
+    :param number: number of the level of the node (1-7)
+    :param level_name: name of the level of the node
+    :param node: `Node` of a level, whose own row is left out, or below one
+    :param path: path of the node, relative to its level (empty for levels)
+
+    :returns: iterator of `tuple`s of (level, level_name, name, path, parent,
+              description, source, status, leaf)
+    """
+
+    nodes = node.walk(f'{path}/' if path else '')
+    if path:
+        nodes = chain([(path, node)], nodes)
+
+    for path, node in nodes:
+        parent = path.rpartition('/')[0] or None
+        yield (number + path.count('/'), level_name, node.name, path,
+               parent, node.description, node.source or None,
+               node.status or None, int(not node.children))
+
+
+def topic_rows(hierarchy: Hierarchy) -> Iterator[tuple]:
+    """
+    Generate the rows of the topics table: one per codelist entry of
+    levels 1-6 and one per node of the level 7+ tree, whose path is
+    relative to the earth-system-discipline level
+
+    :param hierarchy: `Hierarchy` to export
+
+    :returns: iterator of `tuple`s of (level, level_name, name, path, parent,
+              description, source, status, leaf)
+    """
+
+    for number, level in enumerate(hierarchy.levels, start=1):
+        yield from subtree_rows(number, level.name, level)
+
+
+def write_topics_csv(hierarchy: Hierarchy, csv_path: Path) -> None:
+    """
+    Write the sorted list of level 7+ topics as a CSV file
+
+    :param hierarchy: `Hierarchy` to export
+    :param csv_path: path of the CSV file
+
+    :returns: `None`
+    """
+
+    topics = [path for path, node in hierarchy.tree.walk()]
+
+    with csv_path.open('w') as fh:
+        fieldnames = ['Name']
+        writer = csv.DictWriter(fh, fieldnames=fieldnames)
+        writer.writeheader()
+
+        for topic in sorted(topics):
+            writer.writerow({'Name': topic})
+
+
+def write_sqlite(hierarchy: Hierarchy, sqlite_path: Path) -> None:
+    """
+    Write the hierarchy as a SQLite database, indexed on topic path,
+    parent and status
+
+    Topics below a given path can be queried by range on the path index,
+    e.g. `path > 'weather/' AND path < 'weather0'`.
+
+    :param hierarchy: `Hierarchy` to export
+    :param sqlite_path: path of the database, replaced if it exists
+
+    :returns: `None`
+    """
+
+    sqlite_path.unlink(missing_ok=True)
+
+    with sqlite3.connect(sqlite_path) as conn:
+        conn.executescript(SCHEMA)
+        conn.executemany(
+            'INSERT INTO levels VALUES (?, ?, ?)',
+            [(number, level.name, level.description)
+             for number, level in enumerate(hierarchy.levels, start=1)]
+        )
+        conn.executemany(
+            'INSERT INTO topics (level, level_name, name, path, parent, '
+            'description, source, status, leaf) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            topic_rows(hierarchy)
+        )
+    conn.close()
+
+
+def update_sqlite(hierarchy: Hierarchy, sqlite_path: Path,
+                  subtrees: list[Node]) -> None:
+    """
+    Replace the rows of subtrees in a database written by `write_sqlite`,
+    in a single transaction
+
+    :param hierarchy: `Hierarchy` the subtrees belong to
+    :param sqlite_path: path of the database
+    :param subtrees: `Node`s of levels or below, whose rows and the rows of
+                     their descendants are replaced
+
+    :returns: `None`
+    """
+
+    numbers = {level.name: number
+               for number, level in enumerate(hierarchy.levels, start=1)}
+
+    with sqlite3.connect(sqlite_path) as conn:
+        for node in subtrees:
+            level_name, _, path = node.path.partition('/')
+            if path:
+                conn.execute(
+                    'DELETE FROM topics WHERE level_name = ? AND '
+                    '(path = ? OR (path > ? AND path < ?))',
+                    (level_name, path, f'{path}/', f'{path}0')
+                )
+            else:
+                conn.execute('DELETE FROM topics WHERE level_name = ?',
+                             (level_name,))
+            conn.executemany(
+                'INSERT INTO topics (level, level_name, name, path, parent, '
+                'description, source, status, leaf) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                subtree_rows(numbers[level_name], level_name, node, path)
+            )
+    conn.close()
+
+
+def node_to_dict(node: Node) -> dict:
+    """
+    Convert a node and its descendants to a JSON serializable `dict`
+
+    :param node: `Node` to convert
+
+    :returns: `dict` of the node
+    """
+
+    value = {
+        'name': node.name,
+        'description': node.description,
+        'source': node.source or None,
+        'status': node.status or None
+    }
+
+    if node.children:
+        value['children'] = [node_to_dict(c) for c in node.children.values()]
+
+    return value
+
+
+def write_json(hierarchy: Hierarchy, json_path: Path) -> None:
+    """
+    Write the hierarchy as a nested JSON document
+
+    :param hierarchy: `Hierarchy` to export
+    :param json_path: path of the JSON document
+
+    :returns: `None`
+    """
+
+    document = {
+        'levels': [{
+            'level': number,
+            'name': level.name,
+            'description': level.description,
+            'values': [node_to_dict(c) for c in level.children.values()]
+        } for number, level in enumerate(hierarchy.levels, start=1)]
+    }
+
+    with json_path.open('w', encoding='utf-8') as fh:
+        json.dump(document, fh, ensure_ascii=False, indent=1)
+
+
+def update_bundle(hierarchy: Hierarchy, root_path: Path,
+                  subtrees: list[Node]) -> None:
+    """
+    Bring the outputs of the bundle up to date after subtrees of the
+    hierarchy were reloaded: the rows of the subtrees are replaced in the
+    database, the other outputs being single documents are written again
+
+    :param hierarchy: `Hierarchy` to export
+    :param root_path: root of the repository
+    :param subtrees: `Node`s of the reloaded subtrees (the whole database
+                     is written again if the root is one of them)
+
+    :returns: `None`
+    """
+
+    with instrumentation.phase('csv'):
+        write_topics_csv(hierarchy, root_path / TOPICS_CSV)
+
+    with instrumentation.phase('sqlite'):
+        sqlite_path = root_path / SQLITE_FILE
+        if hierarchy.root in subtrees or not sqlite_path.exists():
+            write_sqlite(hierarchy, sqlite_path)
+        else:
+            update_sqlite(hierarchy, sqlite_path, subtrees)
+
+    with instrumentation.phase('json'):
+        write_json(hierarchy, root_path / JSON_FILE)
+
+    with instrumentation.phase('snapshot'):
+        write_snapshot(hierarchy, root_path / SNAPSHOT_FILE)
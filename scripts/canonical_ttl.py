@@ -0,0 +1,343 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+import hashlib
+import re
+from urllib.parse import urljoin
+
+import instrumentation
+
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+SKOS_MEMBER = '<http://www.w3.org/2004/02/skos/core#member>'
+XSD_STRING = 'http://www.w3.org/2001/XMLSchema#string'
+
+TOKEN_REGEX = re.compile(r'''
+    (?P<ws>\s+|\#[^\n]*)
+  | (?P<iri><[^<>"{}|^`\\\s]*>)
+  | (?P<prefix_decl>@prefix\b)
+  | (?P<string>"(?:[^"\\\n\r]|\\.)*")
+  | (?P<lang>@[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)
+  | (?P<datatype>\^\^)
+  | (?P<punct>[.;,])
+  | (?P<a>a(?=[\s<]))
+  | (?P<pname>(?:[A-Za-z][\w.-]*)?:[\w-]*)
+''', re.VERBOSE)
+
+LOCAL_NAME_REGEX = re.compile(r'[A-Za-z_][\w-]*')
+
+# namespaces of the generated TTL
+PREFIXES = {
+    'skos': 'http://www.w3.org/2004/02/skos/core#',
+    'dct': 'http://purl.org/dc/terms/',
+    'ldp': 'http://www.w3.org/ns/ldp#',
+    'reg': 'http://purl.org/linked-data/registry#',
+    'rdfs': 'http://www.w3.org/2000/01/rdf-schema#'
+}
+
+# escapes of string literals, in Turtle and N-Triples
+STRING_ESCAPES = str.maketrans({
+    '\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'
+})
+
+ESCAPE_REGEX = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+
+ESCAPES = {
+    't': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f',
+    '"': '"', "'": "'", '\\': '\\'
+}
+
+
+class UnsupportedTurtle(ValueError):
+    """Turtle outside of the subset supported by the fast parser"""
+    pass
+
+
+def _unescape(match: re.Match) -> str:
+    if match.group(1) or match.group(2):
+        return chr(int(match.group(1) or match.group(2), 16))
+    if match.group(3) not in ESCAPES:
+        raise UnsupportedTurtle(f'Invalid escape \\{match.group(3)}')
+    return ESCAPES[match.group(3)]
+
+
+def escape_string(value: str) -> str:
+    """
+    Escape the value of a string literal, to be enclosed in double quotes
+
+    :param value: lexical value of the literal
+
+    :returns: `str` of the escaped value
+    """
+
+    # most values have nothing to escape
+    if '\\' in value or '"' in value or '\n' in value or '\r' in value:
+        return value.translate(STRING_ESCAPES)
+    return value
+
+
+def format_literal(value: str, lang: str = None,
+                   datatype: str = None) -> str:
+    """
+    Format a literal in canonical N-Triples form
+
+    :param value: lexical value of the literal
+    :param lang: optional language tag
+    :param datatype: optional datatype IRI
+
+    :returns: `str` of the canonical literal
+    """
+
+    value = escape_string(value)
+
+    if lang:
+        return f'"{value}"@{lang.lower()}'
+    if datatype and datatype != XSD_STRING:
+        return f'"{value}"^^<{datatype}>'
+    return f'"{value}"'
+
+
+def _tokenize(ttl: str) -> list[tuple[str, str]]:
+    tokens = []
+    position = 0
+    length = len(ttl)
+
+    while position < length:
+        match = TOKEN_REGEX.match(ttl, position)
+        if match is None:
+            raise UnsupportedTurtle(
+                f'Unsupported syntax at {ttl[position:position + 20]!r}')
+        kind = match.lastgroup
+        if kind != 'ws':
+            tokens.append((kind, match.group()))
+        position = match.end()
+
+    return tokens
+
+
+def parse_simple(ttl: str, base: str = None) -> set[tuple[str, str, str]]:
+    """
+    Parse Turtle made of prefix declarations and statements about IRIs
+    with IRI or string literal objects, as generated by codelists2ttl.py
+
+    :param ttl: Turtle document
+    :param base: base IRI of relative IRIs
+
+    :returns: `set` of (subject, predicate, object) canonical terms
+    """
+
+    tokens = _tokenize(ttl)
+    prefixes = {}
+    triples = set()
+    count = len(tokens)
+    i = 0
+
+    def term(i: int, allow_literal: bool = False) -> tuple[str, int]:
+        if i >= count:
+            raise UnsupportedTurtle('Unexpected end of document')
+        kind, value = tokens[i]
+        if kind == 'iri':
+            iri = value[1:-1]
+            if base is not None:
+                iri = urljoin(base, iri)
+            return f'<{iri}>', i + 1
+        elif kind == 'pname':
+            prefix, _, local = value.partition(':')
+            if prefix not in prefixes:
+                raise UnsupportedTurtle(f'Undefined prefix {prefix}')
+            return f'<{prefixes[prefix]}{local}>', i + 1
+        elif kind == 'string' and allow_literal:
+            literal = ESCAPE_REGEX.sub(_unescape, value[1:-1])
+            if i + 1 < count and tokens[i + 1][0] == 'lang':
+                return format_literal(literal, tokens[i + 1][1][1:]), i + 2
+            if i + 1 < count and tokens[i + 1][0] == 'datatype':
+                datatype, i = term(i + 2)
+                return format_literal(literal, None, datatype[1:-1]), i
+            return format_literal(literal), i + 1
+        raise UnsupportedTurtle(f'Unsupported term {value}')
+
+    def expect(i: int, punct: str) -> int:
+        if i >= count or tokens[i] != ('punct', punct):
+            raise UnsupportedTurtle(f'Expected {punct}')
+        return i + 1
+
+    while i < count:
+        if tokens[i][0] == 'prefix_decl':
+            if i + 2 >= count or tokens[i + 1][0] != 'pname' or \
+                    tokens[i + 2][0] != 'iri' or \
+                    not tokens[i + 1][1].endswith(':'):
+                raise UnsupportedTurtle('Invalid prefix declaration')
+            prefixes[tokens[i + 1][1][:-1]] = tokens[i + 2][1][1:-1]
+            i = expect(i + 3, '.')
+            continue
+
+        subject, i = term(i)
+        while True:
+            if i < count and tokens[i][0] == 'a':
+                predicate, i = RDF_TYPE, i + 1
+            else:
+                predicate, i = term(i)
+            while True:
+                object_, i = term(i, True)
+                triples.add((subject, predicate, object_))
+                if i < count and tokens[i] == ('punct', ','):
+                    i += 1
+                    continue
+                break
+            if i < count and tokens[i] == ('punct', ';'):
+                i += 1
+                if i < count and tokens[i] == ('punct', '.'):
+                    break
+                continue
+            break
+        i = expect(i, '.')
+
+    return triples
+
+
+def _format_rdflib_term(term) -> str:
+    import rdflib
+
+    if isinstance(term, rdflib.Literal):
+        datatype = str(term.datatype) if term.datatype else None
+        return format_literal(str(term), term.language, datatype)
+    elif isinstance(term, rdflib.BNode):
+        return f'_:{term}'
+    return f'<{term}>'
+
+
+def parse_rdflib(ttl: str, base: str = None) -> set[tuple[str, str, str]]:
+    """
+    Parse any Turtle/N3 document with rdflib
+
+    :param ttl: Turtle document
+    :param base: base IRI of relative IRIs
+
+    :returns: `set` of (subject, predicate, object) canonical terms
+    """
+
+    import rdflib
+
+    graph = rdflib.Graph()
+    graph.parse(data=ttl, format='n3', publicID=base)
+
+    return {tuple(_format_rdflib_term(t) for t in triple) for triple in graph}
+
+
+def parse(ttl: str, base: str = None) -> set[tuple[str, str, str]]:
+    """
+    Parse a Turtle document into canonical triples, with the fast parser
+    or with rdflib for documents outside of its subset
+
+    :param ttl: Turtle document
+    :param base: base IRI of relative IRIs
+
+    :returns: `set` of (subject, predicate, object) canonical terms
+    """
+
+    with instrumentation.phase('parse'):
+        try:
+            return parse_simple(ttl, base)
+        except UnsupportedTurtle:
+            instrumentation.increment('parse.rdflib')
+            with instrumentation.phase('parse.rdflib'):
+                return parse_rdflib(ttl, base)
+
+
+def format_ntriples(triples: set[tuple[str, str, str]]) -> str:
+    """
+    Serialize canonical triples as N-Triples, in sorted order
+
+    :param triples: `set` of (subject, predicate, object) canonical terms
+
+    :returns: `str` of N-Triples
+    """
+
+    return ''.join(f'{s} {p} {o} .\n' for s, p, o in sorted(triples))
+
+
+def format_prefixes(prefixes: dict) -> str:
+    """
+    Serialize Turtle prefix declarations
+
+    :param prefixes: `dict` of namespace IRIs by prefix
+
+    :returns: `str` of Turtle prefix declarations, followed by a blank line
+    """
+
+    return ''.join(f'@prefix {prefix}: <{namespace}> .\n'
+                   for prefix, namespace in prefixes.items()) + '\n'
+
+
+def format_turtle(triples: set[tuple[str, str, str]],
+                  prefixes: dict) -> str:
+    """
+    Serialize canonical triples as Turtle statements (without the prefix
+    declarations, see `format_prefixes`), grouped by subject and predicate
+
+    :param triples: `set` of (subject, predicate, object) canonical terms
+    :param prefixes: `dict` of namespace IRIs by prefix, used to compact
+                     IRIs
+
+    :returns: `str` of Turtle statements
+    """
+
+    def compact(term: str) -> str:
+        if term == RDF_TYPE:
+            return 'a'
+        if not term.startswith('<'):
+            return term
+        iri = term[1:-1]
+        for prefix, namespace in prefixes.items():
+            if iri.startswith(namespace) and \
+                    LOCAL_NAME_REGEX.fullmatch(iri[len(namespace):]):
+                return f'{prefix}:{iri[len(namespace):]}'
+        return term
+
+    subjects = {}
+    for s, p, o in triples:
+        subjects.setdefault(s, {}).setdefault(p, []).append(o)
+
+    statements = []
+    for subject in sorted(subjects):
+        predicates = subjects[subject]
+        # rdf:type first, as in the generated TTL
+        order = sorted(predicates, key=lambda p: (p != RDF_TYPE, p))
+        lines = [f'{compact(p)} ' +
+                 ' , '.join(compact(o) for o in sorted(predicates[p]))
+                 for p in order]
+        statements.append(f'{compact(subject)} ' +
+                          ' ;\n        '.join(lines) + ' .\n')
+
+    return '\n'.join(statements)
+
+
+def digest(triples: set[tuple[str, str, str]]) -> str:
+    """
+    Compute the digest of a set of canonical triples (without blank nodes)
+
+    :param triples: `set` of (subject, predicate, object) canonical terms
+
+    :returns: `str` of the hexadecimal SHA-256 digest
+    """
+
+    lines = sorted(f'{s} {p} {o} .' for s, p, o in triples)
+
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
@@ -20,19 +20,86 @@
 ###############################################################################
 
 import argparse
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 import csv
+import ctypes
+import errno
+import hashlib
+import json
+import os
 from pathlib import Path
-import re
 import shutil
-from string import Template
-
-DESCRIPTION_SUFFIX = '-description'
+import tempfile
+import time
+from urllib.parse import urljoin
+
+import bundle
+import canonical_ttl
+import csv_watcher
+from hierarchy import (CSV_DIR, Hierarchy, Node, TOPIC_HIERARCHY_CSV, load,
+                       reload)
+import instrumentation
+from ttl_archive import ArchiveWriter
 
 STATUSES = {
     'Operational': 'Stable',
     'Retired': 'Retired'
 }
 
+# depth of the Level 8+ sub-registers from which subtrees are generated
+# by separate processes when running in parallel
+PARALLEL_SPLIT_DEPTH = 2
+
+# manifest of source CSV hashes and generated TTL files, used to regenerate
+# incrementally; bump the version whenever the generated TTL changes shape
+MANIFEST_FILE = '.topic-hierarchy-manifest.json'
+MANIFEST_VERSION = 3
+
+CONSOLIDATED_DIR = 'wis-consolidated'
+
+# renameat2 arguments, to swap directories atomically
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+PUBLIC_ID_PREFIX = 'http://codes.wmo.int'
+
+
+# shapes of the generated TTL, compiled once: the prefix declarations and
+# the statement about the entry, completed by its status and source
+SUBREGISTER_PREFIXES = canonical_ttl.format_prefixes(canonical_ttl.PREFIXES)
+SUBREGISTER_STATEMENT = (
+    '<%s> a reg:Register , skos:Collection , ldp:Container ;\n'
+    '        ldp:hasMemberRelation skos:member ;\n'
+    '        rdfs:label "%s" ;\n'
+    '        dct:description "%s"'
+)
+CONCEPT_PREFIXES = canonical_ttl.format_prefixes({
+    prefix: canonical_ttl.PREFIXES[prefix]
+    for prefix in ['skos', 'rdfs', 'dct', 'reg']
+})
+CONCEPT_STATEMENT = (
+    '<%s> a skos:Concept ;\n'
+    '        rdfs:label "%s" ;\n'
+    '        skos:notation "%s" ;\n'
+    '        dct:description "%s"@en'
+)
+STATUS_STATEMENT = ' ;\n        reg:status reg:status%s'
+SOURCE_STATEMENT = ' ;\n        rdfs:isDefinedBy "%s" .'
+
+SKOS = canonical_ttl.PREFIXES['skos']
+DCT = canonical_ttl.PREFIXES['dct']
+LDP = canonical_ttl.PREFIXES['ldp']
+REG = canonical_ttl.PREFIXES['reg']
+RDFS = canonical_ttl.PREFIXES['rdfs']
+
+
+def _complete_statement(statement: str, source: str, status: str) -> str:
+    if status in STATUSES:
+        statement += STATUS_STATEMENT % STATUSES[status]
+    if source not in ['', None]:
+        return statement + SOURCE_STATEMENT % canonical_ttl.escape_string(
+            source)
+    return statement + ' .'
+
 
 def gen_skos_subregister(
     name: str, description: str, source: str = None,
@@ -47,34 +114,12 @@ def gen_skos_subregister(
     :returns: `str` of SKOS Sub-register TTL
     """
 
-    SUBREGISTER = '''
-@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
-@prefix dct: <http://purl.org/dc/terms/> .
-@prefix ldp: <http://www.w3.org/ns/ldp#> .
-@prefix reg: <http://purl.org/linked-data/registry#> .
-@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+    label = canonical_ttl.escape_string(name)
+    statement = SUBREGISTER_STATEMENT % (
+        name, label, canonical_ttl.escape_string(description))
 
-<$name> a reg:Register , skos:Collection , ldp:Container ;
-        ldp:hasMemberRelation skos:member ;
-        rdfs:label "$name" ;
-        dct:description "$description"'''
-
-    template_vars = {
-        'name': name,
-        'description': description
-    }
-
-    if status in STATUSES:
-        SUBREGISTER += ' ;\n        reg:status reg:status$status'
-        template_vars['status'] = STATUSES[status]
-
-    if source not in ['', None]:
-        SUBREGISTER += ' ;\n        rdfs:isDefinedBy "$source" .'
-        template_vars['source'] = source
-    else:
-        SUBREGISTER += ' .'
-
-    return Template(SUBREGISTER).substitute(template_vars).strip()
+    return SUBREGISTER_PREFIXES + _complete_statement(statement, source,
+                                                      status)
 
 
 def gen_skos_concept(name: str, description: str, source: str = None,
@@ -89,54 +134,248 @@ def gen_skos_concept(name: str, description: str, source: str = None,
     :returns: `str` of SKOS Concept TTL
     """
 
-    CONCEPT = '''
-@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
-@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
-@prefix dct: <http://purl.org/dc/terms/> .
-@prefix reg: <http://purl.org/linked-data/registry#> .
-
-<$name> a skos:Concept ;
-        rdfs:label "$name" ;
-        skos:notation "$name" ;
-        dct:description "$description"@en'''
-
-    template_vars = {
-        'name': name,
-        'description': description
-    }
-
-    if status in STATUSES:
-        CONCEPT += ' ;\n        reg:status reg:status$status'
-        template_vars['status'] = STATUSES[status]
-
-    if source not in ['', None]:
-        CONCEPT += ' ;\n        rdfs:isDefinedBy "$source" .'
-        template_vars['source'] = source
-    else:
-        CONCEPT += ' .'
+    label = canonical_ttl.escape_string(name)
+    statement = CONCEPT_STATEMENT % (
+        name, label, label, canonical_ttl.escape_string(description))
 
-    return Template(CONCEPT).substitute(template_vars).strip()
+    return CONCEPT_PREFIXES + _complete_statement(statement, source, status)
 
 
 def write_ttl_file(ttl: str, ttl_base_path: Path, relative_path: Path,
-                   verbose: bool = False) -> None:
+                   verbose: bool = False,
+                   only_if_changed: bool = False,
+                   archive: ArchiveWriter = None) -> bool:
     """
     Write TTL to file
 
     :param ttl: `str` the TTL to be written to the file
     :param ttl_base_path: the base path/directory for TTL files
     :param relative_path: the relative path of this TTL file
+    :param verbose: `True` if more details should be printed out
+    :param only_if_changed: `True` to leave an identical existing file alone
+    :param archive: optional archive to add the file to, instead of
+                    writing it, `ttl_base_path` being the path in the archive
 
-    :returns: `None`
+    :returns: `bool` of whether the file was written
     """
 
     file_path = ttl_base_path / relative_path
+    if archive is not None:
+        if verbose:
+            indent = len(relative_path.parents)
+            print_with_indent(indent, f'adding {relative_path}')
+        instrumentation.increment('ttl.files')
+        instrumentation.increment(
+            'ttl.bytes', archive.add(file_path.as_posix(), ttl))
+        return True
+
+    if only_if_changed and file_path.exists():
+        with file_path.open() as fh:
+            if fh.read() == ttl:
+                instrumentation.increment('ttl.unchanged')
+                return False
     if verbose:
         indent = len(relative_path.parents)
         print_with_indent(indent, f'writing {relative_path}')
     with file_path.open('w') as fh:
         fh.write(ttl)
 
+    instrumentation.increment('ttl.files')
+    instrumentation.increment('ttl.bytes', len(ttl.encode('utf-8')))
+
+    return True
+
+
+def manifest_entries(hierarchy: Hierarchy) -> dict:
+    """
+    Compute the manifest entries of a hierarchy: the digest of each source
+    CSV file and the TTL files generated from it
+
+    Whether a row is generated as a sub-register or a concept depends on
+    the existence of a sub-directory of the same name, so the sub-registers
+    are part of the digest.
+
+    :param hierarchy: `Hierarchy` to generate
+
+    :returns: `dict` of manifest entries by source
+    """
+
+    entries = {
+        source: {'hash': hashlib.sha256(digest.encode('utf-8')),
+                 'outputs': []}
+        for source, digest in hierarchy.sources.items()
+    }
+
+    for path, node in hierarchy.root.walk():
+        entry = entries[node.origin]
+        entry['outputs'].append(f'{path}.ttl')
+        if node.register:
+            entry['hash'].update(f'\0{path}'.encode('utf-8'))
+
+    for entry in entries.values():
+        entry['hash'] = entry['hash'].hexdigest()
+
+    return entries
+
+
+def is_current(manifest: dict, source: str, digest: str,
+               ttl_base_path: Path) -> bool:
+    """
+    Check whether the outputs of a source CSV file are up to date
+
+    :param manifest: previous manifest entries (`None` if not incremental)
+    :param source: path of the CSV file, relative to the repository root
+    :param digest: current digest of the CSV file
+    :param ttl_base_path: base path of generated TTL files
+
+    :returns: `True` if the source is unchanged and all its outputs exist
+    """
+
+    if manifest is None or source not in manifest:
+        return False
+
+    entry = manifest[source]
+    return entry['hash'] == digest and all(
+        (ttl_base_path / output).exists() for output in entry['outputs']
+    )
+
+
+def read_manifest(manifest_path: Path) -> dict:
+    """
+    Read the manifest of a previous run
+
+    :param manifest_path: path of the manifest file
+
+    :returns: `dict` of manifest entries by source, or `None` if there is
+              no usable manifest
+    """
+
+    if not manifest_path.exists():
+        return None
+
+    with manifest_path.open() as fh:
+        manifest = json.load(fh)
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+
+    return manifest['sources']
+
+
+def write_manifest(manifest_path: Path, entries: dict) -> None:
+    """
+    Write the manifest of the current run
+
+    :param manifest_path: path of the manifest file
+    :param entries: `dict` of manifest entries by source
+
+    :returns: `None`
+    """
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'sources': dict(sorted(entries.items()))
+    }
+    with manifest_path.open('w') as fh:
+        json.dump(manifest, fh, indent=1)
+
+
+def remove_orphans(manifest: dict, entries: dict, ttl_base_path: Path,
+                   verbose: bool = False) -> int:
+    """
+    Remove TTL files of a previous run which are no longer generated,
+    along with directories left empty
+
+    :param manifest: previous manifest entries
+    :param entries: current manifest entries
+    :param ttl_base_path: base path of generated TTL files
+    :param verbose: `True` if more details should be printed out
+
+    :returns: `int` of files removed
+    """
+
+    outputs = set()
+    for entry in entries.values():
+        outputs.update(entry['outputs'])
+
+    orphans = set()
+    for entry in manifest.values():
+        orphans.update(o for o in entry['outputs'] if o not in outputs)
+
+    for orphan in sorted(orphans, reverse=True):
+        file_path = ttl_base_path / orphan
+        if verbose:
+            print_with_indent(1, f'removing {orphan}')
+        file_path.unlink(missing_ok=True)
+        for directory in file_path.parents:
+            if directory == ttl_base_path or not directory.exists() or \
+                    any(directory.iterdir()):
+                break
+            directory.rmdir()
+
+    return len(orphans)
+
+
+def exchange_paths(path_a: Path, path_b: Path) -> bool:
+    """
+    Exchange two paths atomically, with `renameat2(RENAME_EXCHANGE)`
+
+    :param path_a: `pathlib.Path` of the first path
+    :param path_b: `pathlib.Path` of the second path, on the same
+                   filesystem
+
+    :returns: `bool` of whether the paths were exchanged, `False` if the
+              system or filesystem does not support it
+    """
+
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (AttributeError, OSError):
+        return False
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int,
+                          ctypes.c_char_p, ctypes.c_uint]
+
+    if renameat2(AT_FDCWD, os.fsencode(path_a), AT_FDCWD,
+                 os.fsencode(path_b), RENAME_EXCHANGE) == 0:
+        return True
+
+    error = ctypes.get_errno()
+    if error in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+        return False
+    raise OSError(error, os.strerror(error), str(path_b))
+
+
+def swap_directory(new_path: Path, path: Path) -> None:
+    """
+    Replace a directory with another one, so that the directory never holds
+    a partially generated tree
+
+    The directories are exchanged in a single step where supported (Linux).
+    Otherwise, they are swapped with two renames, between which `path`
+    does not exist for an instant.
+
+    :param new_path: `pathlib.Path` of the replacing directory, on the same
+                     filesystem
+    :param path: `pathlib.Path` of the directory to replace
+
+    :returns: `None`
+    """
+
+    if path.exists() and exchange_paths(new_path, path):
+        # new_path now holds the replaced directory
+        shutil.rmtree(new_path)
+        return
+
+    old_path = None
+    if path.exists():
+        old_path = new_path.with_name(f'{new_path.name}.old')
+        path.rename(old_path)
+
+    new_path.rename(path)
+
+    if old_path is not None:
+        shutil.rmtree(old_path)
+
 
 def print_with_indent(indent: int, message: str) -> None:
     """
@@ -152,288 +391,518 @@ def print_with_indent(indent: int, message: str) -> None:
     print(f'{indent_str}{message}')
 
 
-def process_subdomain_index(relative_path: Path, csv_base_path: Path,
-                            ttl_base_path: Path,
-                            verbose: bool = False,) -> None:
+def node_shape(node: Node) -> tuple[bool, str, str]:
     """
-    Processes recursively all index.csv files in csv_base_path/relative_path
-    and writes output to ttl_base_path/relative_path/
+    Get how a node of the hierarchy is generated
 
-    :param relative_path: relative path to start with
-    :param csv_base_path: base path where to look for CSV files
-    :param ttl_base_path: base path where store generated TTL files
+    :param node: `Node` of the hierarchy
 
-    :returns: `None`
+    :returns: `tuple` of whether the node is a sub-register, and of its
+              source and status
     """
-    indent = len(relative_path.parents) - 1
-    if indent == 1:
-        print_with_indent(indent, f'generating subtree in {relative_path}')
-        indent += 1
-
-    current_csv_dir = csv_base_path / relative_path
-    current_ttl_dir = ttl_base_path / relative_path
-    current_ttl_dir.mkdir()
-    index_file_path = current_csv_dir / 'index.csv'
-    flat_index_file_path = current_csv_dir / 'index-flat.csv'
-    if index_file_path.exists():
-        if verbose:
-            print_with_indent(
-                indent,
-                f'processing {index_file_path.relative_to(csv_base_path)}',
-            )
-            indent += 1
-        with index_file_path.open() as index_file:
-            csv_reader = csv.DictReader(index_file)
-            for csv_record in csv_reader:
-                file_name = csv_record['Name'] + '.ttl'
-                csv_sub_dir = current_csv_dir / csv_record['Name']
-                if csv_sub_dir.exists():
-                    if verbose:
-                        print_with_indent(
-                            indent, f'creating sub-register {file_name}'
-                        )
-                    ttl = gen_skos_subregister(
-                        csv_record['Name'],
-                        csv_record['Description'],
-                        csv_record['Source'],
-                        csv_record['Status']
-                    )
-                    write_ttl_file(
-                        ttl, ttl_base_path, relative_path / file_name, verbose
-                    )
-                    # recursion
-                    process_subdomain_index(
-                        relative_path / csv_record['Name'],
-                        csv_base_path,
-                        ttl_base_path,
-                        verbose,
-                    )
-                else:
-                    if verbose:
-                        print_with_indent(
-                            indent,
-                            f'{relative_path/csv_record["Name"]} is a leaf',
-                        )
-                        print_with_indent(
-                            indent + 1, f'creating concept {file_name}'
-                        )
-                    ttl = gen_skos_concept(
-                        csv_record['Name'],
-                        csv_record['Description'],
-                        csv_record['Source'],
-                        csv_record['Status']
-                    )
-                    write_ttl_file(
-                        ttl, ttl_base_path, relative_path / file_name, verbose
-                    )
-    elif flat_index_file_path.exists():
+
+    if node.parent is None or node.origin == TOPIC_HIERARCHY_CSV:
+        return True, '', 'Operational'
+
+    if node.origin.endswith('index-flat.csv'):
+        # the upper levels of a flat index have no status column
+        return node.register, node.source, node.status or 'Operational'
+
+    return node.register, node.source, node.status
+
+
+def gen_node_ttl(node: Node) -> str:
+    """
+    Generate the TTL of a node of the hierarchy
+
+    :param node: `Node` of the hierarchy
+
+    :returns: `str` of SKOS Sub-register or Concept TTL
+    """
+
+    register, source, status = node_shape(node)
+    if register:
+        return gen_skos_subregister(node.name, node.description, source,
+                                    status)
+    else:
+        return gen_skos_concept(node.name, node.description, source, status)
+
+
+def gen_node_triples(node: Node) -> set[tuple[str, str, str]]:
+    """
+    Generate the triples of a node of the hierarchy, with absolute IRIs,
+    as parsed from its TTL but without generating and parsing it
+
+    :param node: `Node` of the hierarchy
+
+    :returns: `set` of (subject, predicate, object) canonical terms
+    """
+
+    public_id = f'{PUBLIC_ID_PREFIX}/wis/topic-hierarchy'
+    if node.parent is None:
+        name, description = 'topic-hierarchy', 'WIS2 Topic Hierarchy'
+    else:
+        name, description = node.name, node.description
+        public_id = f'{public_id}/{node.path}'
+
+    register, source, status = node_shape(node)
+    subject = f'<{urljoin(public_id, name)}>'
+    label = canonical_ttl.format_literal(name)
+
+    if register:
+        triples = {
+            (subject, canonical_ttl.RDF_TYPE, f'<{REG}Register>'),
+            (subject, canonical_ttl.RDF_TYPE, f'<{SKOS}Collection>'),
+            (subject, canonical_ttl.RDF_TYPE, f'<{LDP}Container>'),
+            (subject, f'<{LDP}hasMemberRelation>', f'<{SKOS}member>'),
+            (subject, f'<{RDFS}label>', label),
+            (subject, f'<{DCT}description>',
+             canonical_ttl.format_literal(description))
+        }
+    else:
+        triples = {
+            (subject, canonical_ttl.RDF_TYPE, f'<{SKOS}Concept>'),
+            (subject, f'<{RDFS}label>', label),
+            (subject, f'<{SKOS}notation>', label),
+            (subject, f'<{DCT}description>',
+             canonical_ttl.format_literal(description, 'en'))
+        }
+
+    if status in STATUSES:
+        triples.add((subject, f'<{REG}status>',
+                     f'<{REG}status{STATUSES[status]}>'))
+    if source not in ['', None]:
+        triples.add((subject, f'<{RDFS}isDefinedBy>',
+                     canonical_ttl.format_literal(source)))
+
+    return triples
+
+
+def format_node(node: Node, ntriples: bool = False) -> str:
+    """
+    Serialize the triples of a node, without prefix declarations
+
+    :param node: `Node` of the hierarchy
+    :param ntriples: `True` for N-Triples, `False` for Turtle
+
+    :returns: `str` of the serialized triples
+    """
+
+    triples = gen_node_triples(node)
+    if ntriples:
+        return canonical_ttl.format_ntriples(triples)
+
+    return canonical_ttl.format_turtle(triples,
+                                       canonical_ttl.PREFIXES) + '\n'
+
+
+def write_consolidated(hierarchy: Hierarchy, output_path: Path,
+                       per_register: bool = False, ntriples: bool = False,
+                       verbose: bool = False) -> int:
+    """
+    Write the hierarchy as consolidated graphs instead of one file per
+    entry: a single file, or one file per register with the registers and
+    concepts it contains (sub-registers with members having their own file)
+
+    :param hierarchy: `Hierarchy` to write
+    :param output_path: directory of the consolidated files
+    :param per_register: `True` for one file per register
+    :param ntriples: `True` for N-Triples, `False` for Turtle
+    :param verbose: `True` if more details should be printed out
+
+    :returns: `int` of files written
+    """
+
+    extension = 'nt' if ntriples else 'ttl'
+    header = ''
+    if not ntriples:
+        header = canonical_ttl.format_prefixes(canonical_ttl.PREFIXES)
+
+    if not per_register:
+        file_path = output_path / f'topic-hierarchy.{extension}'
         if verbose:
-            rel_file_path = flat_index_file_path.relative_to(csv_base_path)
-            print_with_indent(
-                indent,
-                f'processing {rel_file_path}',
+            print_with_indent(1, f'writing {file_path}')
+        size = 0
+        with file_path.open('w', encoding='utf-8') as fh:
+            size += fh.write(header)
+            size += fh.write(format_node(hierarchy.root, ntriples))
+            for _, node in hierarchy.root.walk():
+                size += fh.write(format_node(node, ntriples))
+
+        instrumentation.increment('ttl.files')
+        instrumentation.increment('ttl.bytes', size)
+        return 1
+
+    files = 0
+    registers = [('', hierarchy.root)]
+    registers.extend((path, node) for path, node in hierarchy.root.walk()
+                     if node.children)
+
+    for path, register in registers:
+        relative_path = Path(f'topic-hierarchy/{path}'.rstrip('/') +
+                             f'.{extension}')
+        (output_path / relative_path).parent.mkdir(parents=True,
+                                                   exist_ok=True)
+        contents = [header, format_node(register, ntriples)]
+        contents.extend(format_node(child, ntriples)
+                        for child in register.children.values()
+                        if not child.children)
+        write_ttl_file(''.join(contents), output_path, relative_path,
+                       verbose)
+        files += 1
+
+    return files
+
+
+def write_subtree(node: Node, relative_path: Path, ttl_base_path: Path,
+                  sources: set[str], verbose: bool = False,
+                  only_if_changed: bool = False,
+                  executor: Executor = None,
+                  futures: list[Future] = None,
+                  archive: ArchiveWriter = None) -> int:
+    """
+    Writes recursively the TTL files of the descendants of node into
+    ttl_base_path/relative_path/
+
+    Level 8 subtrees without any node of the given sources are skipped
+    altogether.
+
+    If an executor is given, the subtrees below PARALLEL_SPLIT_DEPTH are
+    submitted to it instead of being processed in the current process; the
+    resulting futures are appended to `futures`.  Each subtree writes to its
+    own directory, so the output is identical to a sequential run.
+
+    :param node: `Node` of the hierarchy
+    :param relative_path: relative path of the node
+    :param ttl_base_path: base path where store generated TTL files
+    :param sources: source CSV files whose nodes are to be (re)generated
+    :param verbose: `True` if more details should be printed out
+    :param only_if_changed: `True` to leave identical existing files alone
+    :param executor: optional executor to process subtrees in parallel
+    :param futures: list collecting futures of the submitted subtrees
+    :param archive: optional archive to add the files to, instead of
+                    writing them (sequential runs only)
+
+    :returns: `int` of Level 8 subtrees skipped
+    """
+
+    skipped = 0
+
+    for child in node.children.values():
+        if child.origin in sources:
+            write_ttl_file(
+                gen_node_ttl(child), ttl_base_path,
+                relative_path / f'{child.name}.ttl', verbose, only_if_changed,
+                archive
             )
+
+        if not child.children and (
+                not child.register or child.origin == TOPIC_HIERARCHY_CSV):
+            continue
+
+        child_path = relative_path / child.name
+        if archive is None:
+            (ttl_base_path / child_path).mkdir(exist_ok=True)
+
+        if len(child_path.parents) == 2:
+            if not any(descendant.origin in sources
+                       for _, descendant in child.walk()):
+                skipped += 1
+                continue
+            print_with_indent(1, f'generating subtree in {child_path}')
+
+        if executor is not None and \
+                len(relative_path.parents) >= PARALLEL_SPLIT_DEPTH:
+            futures.append(executor.submit(
+                instrumentation.run_collected, write_subtree, child,
+                child_path, ttl_base_path, sources, verbose, only_if_changed
+            ))
         else:
-            print_with_indent(
-                indent, f'converting flat CSV to subtree in {relative_path}'
-            )
-        with flat_index_file_path.open() as flat_index_file:
-            csv_records = list(csv.reader(flat_index_file))
-            (name_keys, description_keys) = read_flat_index_keys(
-                csv_records[0][:-1]
-            )
-            name_column = 0
-            process_flat_subdomain_index(
-                csv_records,
-                1,
-                name_column,
-                name_keys,
-                description_keys,
-                relative_path,
-                csv_base_path,
-                ttl_base_path,
-                name_column + 1 == len(name_keys),
-                verbose,
-            )
+            skipped += write_subtree(child, child_path, ttl_base_path,
+                                     sources, verbose, only_if_changed,
+                                     executor, futures, archive)
 
+    return skipped
 
-def read_flat_index_keys(keys: list[str]) -> list[str]:
-    if len(keys) % 2 != 0 or len(keys) == 0:
-        raise RuntimeError(f'Unexpected number of columns {len(keys)}')
-    description_regex = re.compile(r'\w+' + DESCRIPTION_SUFFIX)
-    description_keys = [k for k in keys if description_regex.match(k)]
-    name_keys = [k for k in keys if not description_regex.match(k)]
-    if len(description_keys) != len(name_keys):
-        raise RuntimeError(
-            f'Unexpected number of description columns {len(description_keys)}'
-        )
-    return (name_keys, description_keys)
-
-
-def process_flat_subdomain_index(csv_records: list[str], current_row: int,
-                                 name_column: int, name_keys: list[str],
-                                 description_keys: list[str],
-                                 relative_path: Path,
-                                 csv_base_path: Path,
-                                 ttl_base_path: Path, is_leaf: bool,
-                                 verbose: bool = False,) -> None:
-    """
-    Processes index-flat.csv file as if it was a sub-tree in
-    "csv_base_path/relative_path" where each level is described by two columns
-    in the CSV file, "X" containing domain name and "X-description" containing
-    the description. Columns/levels are processed from left to right, but
-    the order of description columns is not important.
-    The output (sub-tree of TTLs) is written into "ttl_base_path/relative_path"
-
-    :param csv_records: list of CSV records read from the flat file
-    :param current_row: current row in the CSV file
-    :param name_column: index of the (sub-domain) name column in the record
-    :param name_keys: list of (sub-domain) name keys (not descriptions)
-    :param description_keys: list of (sub-domain) description keys
-    :param relative_path: relative path to start with
-    :param csv_base_path: base path where to look for CSV files
-    :param ttl_base_path: base path where store generated TTL files
-    :param is_leaf: `True` if this is the last level of the hierarchy
+
+def regenerate(hierarchy: Hierarchy, root_path: Path, wis_path: Path,
+               entries: dict, changes: set[str], update_bundle: bool = False,
+               verbose: bool = False) -> dict:
+    """
+    Regenerate the outputs affected by changed CSV files: the subtrees
+    defined by them are read again into the hierarchy, and their TTL files
+    of changed sources are written
+
+    :param hierarchy: loaded `Hierarchy`, updated in place
+    :param root_path: root of the repository
+    :param wis_path: directory of the generated TTL files
+    :param entries: `dict` of manifest entries of the generated TTL files
+    :param changes: paths of the changed CSV files and directories,
+                    relative to `root_path`
+    :param update_bundle: `True` to update the outputs of the bundle too
     :param verbose: `True` if more details should be printed out
 
-    :returns: `None`
+    :returns: `dict` of the new manifest entries
     """
 
-    indent = len(relative_path.parents) + name_column
-    current_ttl_dir = ttl_base_path / relative_path
-    if not current_ttl_dir.exists():
-        current_ttl_dir.mkdir()
+    started = time.perf_counter()
+    replaced = reload(hierarchy, root_path, changes)
+    if not replaced:
+        return entries
 
-    name_key = name_keys[name_column]
-    description_key = name_key + DESCRIPTION_SUFFIX
-    column_names = csv_records[0]
-    name_value_previous = ''
-    parent_value_previous = (
-        '' if name_column == 0 else csv_records[current_row][name_column - 1]
-    )
+    topic_hierarchy_ttl_dir = wis_path / 'topic-hierarchy'
+    new_entries = manifest_entries(hierarchy)
+    sources = {
+        source for source, entry in new_entries.items()
+        if source not in entries or entries[source]['hash'] != entry['hash']
+    }
 
-    while current_row < len(csv_records) and (
-        name_column == 0
-        or csv_records[current_row][name_column - 1] == parent_value_previous
-    ):
-        csv_record = csv_records[current_row]
-        name_value = csv_record[column_names.index(name_key)]
-        description_value = csv_record[column_names.index(description_key)]
-
-        if name_value != name_value_previous:
-            name_value_previous = name_value
-            file_name = name_value + '.ttl'
-            if not is_leaf:
-                if verbose:
-                    print_with_indent(
-                        indent,
-                        f'creating sub-register/{name_key} "{name_value}"',
-                    )
-                ttl = gen_skos_subregister(name_value, description_value, '')
-                write_ttl_file(
-                    ttl, ttl_base_path, relative_path / file_name, verbose
-                )
-                # recursion
-                next_level_name_column = name_column + 1
-                process_flat_subdomain_index(
-                    csv_records,
-                    current_row,
-                    next_level_name_column,
-                    name_keys,
-                    description_keys,
-                    relative_path / name_value,
-                    csv_base_path,
-                    ttl_base_path,
-                    next_level_name_column + 1 == len(name_keys),
-                    verbose
-                )
-            else:  # is leaf
-                if verbose:
-                    print_with_indent(
-                        indent, f'creating concept/{name_key} "{name_value}"'
-                    )
-                # TODO: source?
-                ttl = gen_skos_concept(name_value, description_value, '')
-                write_ttl_file(
-                    ttl, ttl_base_path, relative_path / file_name, verbose
-                )
-        current_row += 1
+    with instrumentation.phase('generate'):
+        for _, node in replaced:
+            relative_path = Path(node.path)
+            (topic_hierarchy_ttl_dir / relative_path).mkdir(
+                parents=True, exist_ok=True)
+            write_subtree(node, relative_path, topic_hierarchy_ttl_dir,
+                          sources, verbose, True)
 
+    with instrumentation.phase('cleanup'):
+        remove_orphans(entries, new_entries, topic_hierarchy_ttl_dir,
+                       verbose)
+        write_manifest(wis_path / MANIFEST_FILE, new_entries)
 
-parser = argparse.ArgumentParser()
-parser.add_argument(
-    '-v', '--verbose', action='store_true', help='Print more details'
-)
-args = parser.parse_args()
+    if update_bundle:
+        bundle.update_bundle(hierarchy, root_path,
+                             [node for _, node in replaced])
 
-ROOT_PATH = Path.cwd()
-CSV_FILES_PATH = ROOT_PATH / 'topic-hierarchy'
-COLLECTIONS = []
+    elapsed = time.perf_counter() - started
+    for _, node in replaced:
+        print_with_indent(
+            1, f'regenerated {node.path or node.name} in {elapsed:.3f}s')
 
-print('Re-generating WIS2 Topic Hierarchy TTL files')
+    return new_entries
 
-topic_hierarchy_ttl_dir = ROOT_PATH / 'wis/topic-hierarchy'
-if topic_hierarchy_ttl_dir.exists():
-    print_with_indent(1, f'removed {topic_hierarchy_ttl_dir}')
-    shutil.rmtree(topic_hierarchy_ttl_dir)
-topic_hierarchy_ttl_dir.mkdir(parents=True)
 
-topic_hierarchy_csv_path = ROOT_PATH / 'topic-hierarchy.csv'
+def watch(hierarchy: Hierarchy, root_path: Path, wis_path: Path,
+          entries: dict, update_bundle: bool = False, poll: bool = False,
+          verbose: bool = False) -> None:
+    """
+    Watch the CSV files, regenerating the outputs affected by each burst
+    of changes until interrupted
+
+    A change which cannot be read (e.g. a file being edited) is retried
+    along with the next ones.
+
+    :param hierarchy: loaded `Hierarchy`, kept up to date
+    :param root_path: root of the repository
+    :param wis_path: directory of the generated TTL files
+    :param entries: `dict` of manifest entries of the generated TTL files
+    :param update_bundle: `True` to update the outputs of the bundle too
+    :param poll: `True` to poll the files even if inotify is available
+    :param verbose: `True` if more details should be printed out
 
-topic_hierarchy_ttl_path = ROOT_PATH / 'wis' / 'topic-hierarchy.ttl'
-with topic_hierarchy_ttl_path.open('w') as topic_hierarchy_ttl_file:
-    ttl = gen_skos_subregister('topic-hierarchy', 'WIS2 Topic Hierarchy')
-    topic_hierarchy_ttl_file.write(ttl)
+    :returns: `None`
+    """
 
+    watcher = csv_watcher.open_watcher(
+        root_path, [TOPIC_HIERARCHY_CSV, CSV_DIR], poll)
+    print_with_indent(1, f'watching {CSV_DIR} with '
+                         f'{type(watcher).__name__}, Ctrl-C to stop')
+
+    pending = set()
+    try:
+        for changes in csv_watcher.debounce(watcher):
+            pending.update(changes)
+            try:
+                entries = regenerate(hierarchy, root_path, wis_path,
+                                     entries, pending, update_bundle,
+                                     verbose)
+            except (csv.Error, KeyError, OSError, RuntimeError,
+                    ValueError) as err:
+                print_with_indent(1, f'cannot read changes, waiting: {err}')
+                continue
+            pending.clear()
+    finally:
+        watcher.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', help='Print more details'
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='Number of processes generating Level 8+ subtrees in parallel'
+    )
+    parser.add_argument(
+        '-i', '--incremental', action='store_true',
+        help='Only regenerate TTL files of changed CSV files'
+    )
+    parser.add_argument(
+        '-c', '--consolidate', choices=['register', 'hierarchy'],
+        help=f'Write one graph per register or for the whole hierarchy in {CONSOLIDATED_DIR}, instead of one TTL file per entry'  # noqa
+    )
+    parser.add_argument(
+        '--ntriples', action='store_true',
+        help='Write consolidated graphs as N-Triples instead of Turtle'
+    )
+    parser.add_argument(
+        '-a', '--archive', type=Path,
+        help='Write the TTL files into a zip or tar archive (e.g. wis.zip, wis.tar.gz) instead of the wis directory'  # noqa
+    )
+    parser.add_argument(
+        '--atomic', action='store_true',
+        help='Generate in a temporary directory, then swap it with the wis directory'  # noqa
+    )
+    parser.add_argument(
+        '-w', '--watch', action='store_true',
+        help='Keep running, regenerating the TTL files affected by each change to the CSV files'  # noqa
+    )
+    parser.add_argument(
+        '--bundle', action='store_true',
+        help='In watch mode, also keep the outputs of generate-bundle.py up to date'  # noqa
+    )
+    parser.add_argument(
+        '--poll', action='store_true',
+        help='In watch mode, poll the CSV files instead of using inotify'
+    )
+    parser.add_argument(
+        '--report', type=Path,
+        help='File to write a JSON report of timings and counters to'
+    )
+    parser.add_argument(
+        '--profile', type=Path,
+        help='File to write a cProfile dump of the hot paths to'
+    )
+    args = parser.parse_args()
 
-with topic_hierarchy_csv_path.open() as root_table_file:
-    subregisters = []
-    reader = csv.DictReader(root_table_file)
-    for row in reader:
-        subregister_url = 'http://codes.wmo.int/wis/topic-hierarchy'
-        subregisters.append(f'<{subregister_url}>')
-        register_ttl_file_name = Path(f'{row["Name"]}.ttl')
+    if args.archive is not None and (args.jobs > 1 or args.incremental):
+        parser.error('--archive cannot be combined with --jobs or '
+                     '--incremental')
+    if args.atomic and args.incremental:
+        parser.error('--atomic cannot be combined with --incremental')
+    if args.watch and (args.consolidate or args.archive or args.atomic):
+        parser.error('--watch cannot be combined with --consolidate, '
+                     '--archive or --atomic')
 
-        ttl = gen_skos_subregister(row['Name'], row['Description'])
-        write_ttl_file(
-            ttl, topic_hierarchy_ttl_dir, register_ttl_file_name, True
-        )
+    if args.profile is not None:
+        instrumentation.recorder.enable_profiling()
 
-        if row['Name'] != 'earth-system-discipline':
-            concept_csv_file = ROOT_PATH / f'topic-hierarchy/{row["Name"]}.csv'
+    ROOT_PATH = Path.cwd()
 
-            with concept_csv_file.open() as concept_csv_file:
-                reader2 = csv.DictReader(concept_csv_file)
-                for row2 in reader2:
-                    concept_ttl_dir = (
-                        topic_hierarchy_ttl_dir / f'{row["Name"]}'
-                    )
-                    if not concept_ttl_dir.exists():
-                        concept_ttl_dir.mkdir()
-                    concept_ttl_file = concept_ttl_dir / f'{row2["Name"]}.ttl'
-                    relative_concept_ttl_path = concept_ttl_file.relative_to(
-                        topic_hierarchy_ttl_dir
-                    )
-                    ttl = gen_skos_concept(
-                        row2['Name'], row2['Description'], row2['Source'],
-                        row2['Status']
-                    )
-                    write_ttl_file(
-                        ttl,
-                        topic_hierarchy_ttl_dir,
-                        relative_concept_ttl_path,
-                        args.verbose
-                    )
+    print('Re-generating WIS2 Topic Hierarchy TTL files')
 
+    with instrumentation.phase('load'):
+        hierarchy = load(ROOT_PATH)
 
-print('Level 1-7 completed')
+    if args.consolidate is not None:
+        consolidated_dir = ROOT_PATH / CONSOLIDATED_DIR
+        if consolidated_dir.exists():
+            shutil.rmtree(consolidated_dir)
+        consolidated_dir.mkdir()
 
-print('Generating Level 8+')
-process_subdomain_index(
-    Path('earth-system-discipline'),
-    CSV_FILES_PATH,
-    topic_hierarchy_ttl_dir,
-    args.verbose
-)
+        with instrumentation.phase('generate'):
+            written = write_consolidated(
+                hierarchy, consolidated_dir,
+                args.consolidate == 'register', args.ntriples, args.verbose
+            )
+        print_with_indent(1, f'wrote {written} files in {consolidated_dir}')
+    elif args.archive is not None:
+        with instrumentation.phase('generate'), \
+                ArchiveWriter(args.archive) as archive:
+            root = hierarchy.root
+            write_ttl_file(
+                gen_skos_subregister(root.name, root.description),
+                Path('wis'), Path('topic-hierarchy.ttl'), archive=archive
+            )
+            write_subtree(hierarchy.root, Path(),
+                          Path('wis/topic-hierarchy'), set(hierarchy.sources),
+                          args.verbose, archive=archive)
+        print_with_indent(1, f'wrote {archive.files} files in {args.archive}')
+    else:
+        wis_path = ROOT_PATH / 'wis'
+        if args.atomic:
+            wis_path = Path(tempfile.mkdtemp(prefix='.wis-', dir=ROOT_PATH))
+            wis_path.chmod(0o755)
+
+        # with --atomic, the temporary directory is removed if generation fails
+        try:
+            topic_hierarchy_ttl_dir = wis_path / 'topic-hierarchy'
+            manifest_path = wis_path / MANIFEST_FILE
+            manifest = None
+            if args.incremental:
+                manifest = read_manifest(manifest_path)
+                if manifest is None:
+                    print_with_indent(
+                        1, 'no usable manifest, regenerating all')
+            if manifest is None and topic_hierarchy_ttl_dir.exists():
+                print_with_indent(1, f'removed {topic_hierarchy_ttl_dir}')
+                shutil.rmtree(topic_hierarchy_ttl_dir)
+            topic_hierarchy_ttl_dir.mkdir(parents=True, exist_ok=True)
+
+            write_ttl_file(
+                gen_skos_subregister('topic-hierarchy',
+                                     'WIS2 Topic Hierarchy'),
+                wis_path, Path('topic-hierarchy.ttl'),
+                only_if_changed=manifest is not None
+            )
 
-print('Done')
+            entries = manifest_entries(hierarchy)
+            sources = {
+                source for source, entry in entries.items()
+                if not is_current(manifest, source, entry['hash'],
+                                  topic_hierarchy_ttl_dir)
+            }
+
+            with instrumentation.phase('generate'):
+                if args.jobs > 1:
+                    with ProcessPoolExecutor(
+                            max_workers=args.jobs) as executor:
+                        futures = []
+                        skipped = write_subtree(
+                            hierarchy.root, Path(), topic_hierarchy_ttl_dir,
+                            sources, args.verbose, manifest is not None,
+                            executor, futures)
+                        for future in futures:
+                            _, snapshot = future.result()
+                            instrumentation.recorder.merge(snapshot)
+                else:
+                    skipped = write_subtree(
+                        hierarchy.root, Path(), topic_hierarchy_ttl_dir,
+                        sources, args.verbose, manifest is not None)
+            if skipped:
+                print_with_indent(1, f'skipped {skipped} unchanged subtrees')
+
+            with instrumentation.phase('cleanup'):
+                if manifest is not None:
+                    removed = remove_orphans(
+                        manifest, entries, topic_hierarchy_ttl_dir,
+                        args.verbose
+                    )
+                    print_with_indent(
+                        1, f'removed {removed} orphaned TTL files')
+
+                write_manifest(manifest_path, entries)
+
+            if args.atomic:
+                swap_directory(wis_path, ROOT_PATH / 'wis')
+                print_with_indent(1, f'replaced {ROOT_PATH / "wis"}')
+        finally:
+            if args.atomic and wis_path.exists():
+                shutil.rmtree(wis_path)
+
+    if args.report is not None:
+        instrumentation.recorder.write_report(args.report, 'codelists2ttl.py')
+    if args.profile is not None:
+        instrumentation.recorder.write_profile(args.profile)
+
+    if args.watch:
+        if args.bundle:
+            bundle.update_bundle(hierarchy, ROOT_PATH, [hierarchy.root])
+        try:
+            watch(hierarchy, ROOT_PATH, wis_path, entries, args.bundle,
+                  args.poll, args.verbose)
+        except KeyboardInterrupt:
+            pass
+
+    print('Done')
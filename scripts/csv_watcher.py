@@ -0,0 +1,322 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+import ctypes
+import ctypes.util
+import os
+from pathlib import Path
+import select
+import struct
+import time
+from typing import Iterator
+
+import instrumentation
+
+# delay without further changes before a burst of changes is reported
+DEBOUNCE = 0.2
+POLL_INTERVAL = 0.5
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE)
+EVENT = struct.Struct('iIII')
+
+
+class PollingWatcher:
+    """
+    Watcher of the CSV files and directories below paths, comparing their
+    modification times and sizes at regular intervals
+    """
+
+    def __init__(self, root_path: Path, paths: list[str],
+                 interval: float = POLL_INTERVAL) -> None:
+        """
+        Initialize a watcher
+
+        :param root_path: directory the paths are relative to
+        :param paths: CSV files and directories (watched recursively),
+                      relative to `root_path`
+        :param interval: seconds between two scans
+
+        :returns: `None`
+        """
+
+        self.root_path = root_path
+        self.paths = paths
+        self.interval = interval
+        self.state = self.scan()
+
+    def scan(self) -> dict:
+        """
+        List the watched CSV files and directories
+
+        :returns: `dict` of (modification time, size) by path, relative to
+                  the root (`None` for directories)
+        """
+
+        state = {}
+        for path in self.paths:
+            full_path = self.root_path / path
+            if full_path.is_file():
+                stat = full_path.stat()
+                state[path] = (stat.st_mtime_ns, stat.st_size)
+                continue
+            for directory, _, files in os.walk(full_path):
+                relative = Path(directory).relative_to(
+                    self.root_path).as_posix()
+                state[relative] = None
+                for name in files:
+                    if not name.endswith('.csv'):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        continue
+                    state[f'{relative}/{name}'] = (stat.st_mtime_ns,
+                                                   stat.st_size)
+
+        instrumentation.increment('watch.scans')
+        return state
+
+    def wait(self, timeout: float = None) -> set[str]:
+        """
+        Wait for changes
+
+        :param timeout: seconds to wait at most, forever if `None`
+
+        :returns: `set` of the changed paths, relative to the root (empty
+                  if none changed before the timeout)
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
+
+            state = self.scan()
+            changes = {path for path in state.keys() | self.state.keys()
+                       if state.get(path) != self.state.get(path)}
+            self.state = state
+            if changes or (deadline is not None and
+                           time.monotonic() >= deadline):
+                return changes
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """
+    Watcher of the CSV files and directories below paths, notified of
+    changes by the Linux kernel
+    """
+
+    def __init__(self, root_path: Path, paths: list[str]) -> None:
+        """
+        Initialize a watcher
+
+        :param root_path: directory the paths are relative to
+        :param paths: CSV files and directories (watched recursively),
+                      relative to `root_path`
+
+        :returns: `None`
+        """
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        # AttributeError if the C library has no inotify
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                    ctypes.c_uint32]
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.root_path = root_path
+        # watched directories by watch descriptor, and the names of the
+        # files watched in them (`None` for all CSV files)
+        self.directories = {}
+        self.files = {}
+        for path in paths:
+            if (root_path / path).is_dir():
+                self.watch_tree(path)
+            else:
+                directory, _, name = path.rpartition('/')
+                wd = self.watch(directory or '.', recursive=False)
+                self.files.setdefault(wd, set()).add(name)
+
+    def watch(self, path: str, recursive: bool = True) -> int:
+        """
+        Watch a directory
+
+        :param path: path of the directory, relative to the root
+        :param recursive: `True` to report all CSV files and directories
+                          created in it
+
+        :returns: `int` of the watch descriptor
+        """
+
+        wd = self._add_watch(self.fd, os.fsencode(self.root_path / path),
+                             WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+
+        self.directories[wd] = path
+        if recursive:
+            self.files[wd] = None
+
+        return wd
+
+    def watch_tree(self, path: str) -> None:
+        """
+        Watch a directory and its sub-directories
+
+        :param path: path of the directory, relative to the root
+
+        :returns: `None`
+        """
+
+        for directory, _, _ in os.walk(self.root_path / path):
+            self.watch(Path(directory).relative_to(self.root_path).as_posix())
+
+    def read_events(self) -> set[str]:
+        changes = set()
+
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changes
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            instrumentation.increment('watch.events')
+
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, everything may have changed
+                changes.update(self.directories.values())
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                self.files.pop(wd, None)
+                continue
+
+            name = os.fsdecode(name)
+            names = self.files.get(wd)
+            is_dir = bool(mask & IN_ISDIR)
+            if names is None:
+                if not is_dir and not name.endswith('.csv'):
+                    continue
+            elif name not in names:
+                continue
+
+            directory = self.directories[wd]
+            path = name if directory == '.' else f'{directory}/{name}'
+            changes.add(path)
+            if is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                self.watch_tree(path)
+
+        return changes
+
+    def wait(self, timeout: float = None) -> set[str]:
+        """
+        Wait for changes
+
+        :param timeout: seconds to wait at most, forever if `None`
+
+        :returns: `set` of the changed paths, relative to the root (empty
+                  if none changed before the timeout)
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            delay = None
+            if deadline is not None:
+                delay = max(deadline - time.monotonic(), 0)
+            readable, _, _ = select.select([self.fd], [], [], delay)
+            if not readable:
+                return set()
+            changes = self.read_events()
+            if changes:
+                return changes
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def open_watcher(root_path: Path, paths: list[str], poll: bool = False):
+    """
+    Open a watcher of CSV files and directories, with inotify if available
+
+    :param root_path: directory the paths are relative to
+    :param paths: CSV files and directories (watched recursively),
+                  relative to `root_path`
+    :param poll: `True` to poll even if inotify is available
+
+    :returns: `InotifyWatcher` or `PollingWatcher`
+    """
+
+    if not poll:
+        try:
+            return InotifyWatcher(root_path, paths)
+        except (AttributeError, OSError, TypeError):
+            pass
+
+    return PollingWatcher(root_path, paths)
+
+
+def debounce(watcher, delay: float = DEBOUNCE) -> Iterator[set[str]]:
+    """
+    Generate the changes reported by a watcher, grouping a burst of changes
+    until none happened for a delay
+
+    :param watcher: `InotifyWatcher` or `PollingWatcher`
+    :param delay: seconds without changes ending a burst
+
+    :returns: iterator of `set`s of changed paths
+    """
+
+    while True:
+        changes = watcher.wait()
+        while True:
+            more = watcher.wait(delay)
+            if not more:
+                break
+            changes.update(more)
+        yield changes
@@ -0,0 +1,403 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+import argparse
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import random
+import signal
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+import uuid
+
+import canonical_ttl
+
+PUBLIC_ID_PREFIX = 'http://codes.wmo.int'
+LDP_NEXT_PAGE = '<http://www.w3.org/ns/ldp#nextPage>'
+SESSION_COOKIE = 'JSESSIONID'
+ROOT_REGISTER = 'wis'
+REG_REGISTER = '<http://purl.org/linked-data/registry#Register>'
+
+
+class FakeRegistry:
+    """
+    In-memory registers and entries of a fake WMO Codes Registry, with
+    injectable latency, errors and throttling
+    """
+
+    def __init__(self, latency: float = 0, jitter: float = 0,
+                 error_rate: float = 0, rate_limit: float = 0,
+                 page_size: int = 100, password: str = None,
+                 seed: int = None) -> None:
+        """
+        Initialize an empty registry
+
+        :param latency: delay of every response, in seconds
+        :param jitter: maximum random delay added to the latency, in seconds
+        :param error_rate: probability of a request failing with a 503
+        :param rate_limit: requests per second above which requests are
+                           refused with a 429 (0 for no limit)
+        :param page_size: number of members per page of a register
+        :param password: password accepted at login (any if `None`)
+        :param seed: seed of the random latency and errors
+
+        :returns: `None`
+        """
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.page_size = page_size
+        self.password = password
+        self.random = random.Random(seed)
+
+        # triples of each entry, and members of each register, by path;
+        # the wis register is created once by hand on the actual registries
+        self.entries = {ROOT_REGISTER: {(
+            f'<{PUBLIC_ID_PREFIX}/{ROOT_REGISTER}>', canonical_ttl.RDF_TYPE,
+            REG_REGISTER
+        )}}
+        self.members = {'': [ROOT_REGISTER], ROOT_REGISTER: []}
+        self.sessions = set()
+        self.stats = {}
+
+        self._tokens = rate_limit
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+
+    def load(self, directory: Path) -> int:
+        """
+        Register every entry of a TTL directory, as if already uploaded
+
+        :param directory: `pathlib.Path` of the directory with TTL files
+                          (e.g. `wis`)
+
+        :returns: `int` of entries loaded
+        """
+
+        filepaths = sorted(directory.rglob('*.ttl'),
+                           key=lambda f: len(f.parts))
+        for filepath in filepaths:
+            rel_id = (filepath.parent / filepath.stem).relative_to(
+                directory.parent).as_posix()
+            ttl = filepath.read_text(encoding='utf-8')
+            self.store(rel_id, canonical_ttl.parse(
+                ttl, f'{PUBLIC_ID_PREFIX}/{rel_id}'))
+
+        return len(filepaths)
+
+    def store(self, path: str, triples: set) -> None:
+        """
+        Create or replace an entry
+
+        :param path: path of the entry (e.g. `wis/topic-hierarchy`)
+        :param triples: `set` of canonical triples of the entry
+
+        :returns: `None`
+        """
+
+        parent = path.rpartition('/')[0]
+        with self._lock:
+            if path not in self.entries:
+                self.members.setdefault(parent, []).append(path)
+                self.members.setdefault(path, [])
+            self.entries[path] = triples
+
+    def throttle(self) -> bool:
+        """
+        Take a token from the rate limiter
+
+        :returns: `True` if the request is to be refused
+        """
+
+        if not self.rate_limit:
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate_limit,
+                self._tokens + (now - self._refilled) * self.rate_limit)
+            self._refilled = now
+            if self._tokens < 1:
+                return True
+            self._tokens -= 1
+
+        return False
+
+    def count(self, method: str, status: int) -> None:
+        with self._lock:
+            key = f'{method} {status}'
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def page(self, path: str, page: int, base_url: str) -> str:
+        """
+        Serialize a page of a register with its members, as N-Triples
+
+        :param path: path of the register
+        :param page: number of the page, from 0
+        :param base_url: base URL of the server, for the next page link
+
+        :returns: `str` of the page
+        """
+
+        with self._lock:
+            members = self.members.get(path, [])
+            start = page * self.page_size
+            paths = members[start:start + self.page_size]
+            if page == 0:
+                paths = [path] + paths
+            lines = [f'{s} {p} {o} .'
+                     for member in paths
+                     for s, p, o in sorted(self.entries[member])]
+
+        if start + self.page_size < len(members):
+            lines.append(
+                f'<{PUBLIC_ID_PREFIX}/{path}> {LDP_NEXT_PAGE} '
+                f'<{base_url}/{path}?_view=with_metadata'
+                f'&_page={page + 1}> .')
+
+        return '\n'.join(lines) + '\n'
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    """HTTP interface of a `FakeRegistry`, as used by upload_changes.py"""
+
+    registry: FakeRegistry = None
+    verbose = False
+    # connections are kept alive, as by the registry
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self) -> None:
+        super().setup()
+        self.registry.count('connections', 'opened')
+
+    def log_message(self, format: str, *args) -> None:
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def respond(self, status: int, body: str = '',
+                headers: dict = None) -> None:
+        self.registry.count(self.command, status)
+        content = body.encode('utf-8')
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if content:
+            self.send_header('Content-Type', 'text/turtle; charset=UTF-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def intercept(self) -> bool:
+        """
+        Apply the latency, throttling and error injection of the registry
+
+        :returns: `True` if a response has already been sent
+        """
+
+        registry = self.registry
+        delay = registry.latency + registry.random.uniform(0, registry.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if registry.throttle():
+            self.respond(429, 'Too many requests', {'Retry-After': '1'})
+            return True
+        if registry.error_rate and \
+                registry.random.random() < registry.error_rate:
+            self.respond(503, 'Injected error')
+            return True
+
+        return False
+
+    def read_body(self) -> str:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length).decode('utf-8')
+
+    def authenticated(self) -> bool:
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        morsel = cookie.get(SESSION_COOKIE)
+        if morsel is None or morsel.value not in self.registry.sessions:
+            self.respond(401, 'Not logged in')
+            return False
+        return True
+
+    def target(self) -> tuple[str, dict]:
+        url = urlsplit(self.path)
+        return url.path.strip('/'), parse_qs(url.query, True)
+
+    def do_GET(self) -> None:
+        if self.intercept():
+            return
+
+        path, query = self.target()
+        if path not in self.registry.entries:
+            self.respond(404, f'{path} not found')
+        elif '_view' in query:
+            page = int(query.get('_page', ['0'])[0])
+            base_url = f'http://{self.headers["Host"]}'
+            self.respond(200, self.registry.page(path, page, base_url))
+        else:
+            triples = sorted(self.registry.entries[path])
+            self.respond(200, ''.join(f'{s} {p} {o} .\n'
+                                      for s, p, o in triples))
+
+    def do_POST(self) -> None:
+        path, _ = self.target()
+        if path == 'system/security/apilogin':
+            form = parse_qs(self.read_body())
+            password = form.get('password', [None])[0]
+            if self.registry.password not in (None, password):
+                self.respond(401, 'Invalid credentials')
+                return
+            session_id = uuid.uuid4().hex
+            self.registry.sessions.add(session_id)
+            self.respond(200, '', {
+                'Set-Cookie': f'{SESSION_COOKIE}={session_id}; Path=/'})
+            return
+
+        body = self.read_body()
+        if self.intercept() or not self.authenticated():
+            return
+
+        _, query = self.target()
+        if path and path not in self.registry.entries:
+            self.respond(404, f'Register {path} not found')
+            return
+
+        register_id = f'{PUBLIC_ID_PREFIX}/{path}/' if path else \
+            f'{PUBLIC_ID_PREFIX}/'
+        try:
+            triples = canonical_ttl.parse(body, register_id)
+        except Exception as err:
+            self.respond(400, f'Invalid payload: {err}')
+            return
+
+        # a batch registers a new register with its skos:member entries
+        members = set()
+        if 'batch-managed' in query:
+            relation = canonical_ttl.SKOS_MEMBER
+            members = {o for _, p, o in triples if p == relation}
+            triples = {t for t in triples if t[1] != relation}
+
+        subjects = {s for s, _, _ in triples} - members
+        if len(subjects) != 1:
+            self.respond(400, 'Payload must describe exactly one entry')
+            return
+
+        subject = subjects.pop()
+        entry = subject[1:-1][len(PUBLIC_ID_PREFIX) + 1:]
+        if entry.rpartition('/')[0] != path:
+            self.respond(400, f'Entry {entry} is not a member of {path}')
+            return
+        elif entry in self.registry.entries:
+            self.respond(403, f'Entry {entry} already registered')
+            return
+
+        member_entries = {}
+        for member in members:
+            member_entry = member[1:-1][len(PUBLIC_ID_PREFIX) + 1:]
+            if member_entry.rpartition('/')[0] != entry:
+                self.respond(400, f'{member_entry} is not a member of {entry}')
+                return
+            member_entries[member_entry] = {t for t in triples
+                                            if t[0] == member}
+
+        self.registry.store(entry, {t for t in triples if t[0] == subject})
+        for member_entry, member_triples in sorted(member_entries.items()):
+            self.registry.store(member_entry, member_triples)
+        self.respond(201)
+
+    def do_PUT(self) -> None:
+        path, query = self.target()
+        body = self.read_body()
+        if self.intercept() or not self.authenticated():
+            return
+
+        if path not in self.registry.entries:
+            self.respond(404, f'{path} not found')
+            return
+        if query.get('non-member-properties') != ['true']:
+            self.respond(400, 'Only non-member-properties updates supported')
+            return
+
+        try:
+            triples = canonical_ttl.parse(body, f'{PUBLIC_ID_PREFIX}/{path}')
+        except Exception as err:
+            self.respond(400, f'Invalid payload: {err}')
+            return
+
+        self.registry.store(path, triples)
+        self.respond(204)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--port', type=int, default=8080,
+                        help='Port to listen on')
+    parser.add_argument('-l', '--load',
+                        help='Directory of TTL files to register at startup')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Delay of every response, in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='Maximum random delay added, in milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='Probability of a request failing with a 503')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='Requests per second above which requests are refused with a 429')  # noqa
+    parser.add_argument('--page-size', type=int, default=100,
+                        help='Number of members per page of a register')
+    parser.add_argument('--password', help='Password accepted at login')
+    parser.add_argument('--seed', type=int,
+                        help='Seed of the random latency and errors')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Log every request')
+
+    args = parser.parse_args()
+
+    registry = FakeRegistry(args.latency / 1000, args.jitter / 1000,
+                            args.error_rate, args.rate_limit,
+                            args.page_size, args.password, args.seed)
+    if args.load is not None:
+        loaded = registry.load(Path(args.load))
+        print(f'Loaded {loaded} entries from {args.load}')
+
+    RegistryHandler.registry = registry
+    RegistryHandler.verbose = args.verbose
+    server = ThreadingHTTPServer(('localhost', args.port), RegistryHandler)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    print(f'Fake registry listening on http://localhost:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for key, count in sorted(registry.stats.items()):
+            print(f'{key}: {count}')
@@ -19,43 +19,55 @@
 #
 ###############################################################################
 
-import csv
-import os
-
-topics = []
-
-for root, dirs, files in os.walk('topic-hierarchy/earth-system-discipline'):
-    for file_ in files:
-        if file_.endswith('.csv'):
-            root2 = root.replace('topic-hierarchy/earth-system-discipline', '')
-            if root2.startswith('/'):
-                root2 = root2.replace('/', '', 1)
-            filename = os.path.join(root, file_)
-            with open(filename) as fh2:
-                reader = csv.reader(fh2)
-                next(reader)
-                if file_.endswith('index.csv'):
-                    print('Processing hierarchical index CSV')
-                    for row in reader:
-                        topic_to_add = f'{root2}/{row[0]}'
-                        if topic_to_add.startswith('/'):
-                            topic_to_add = topic_to_add.lstrip('/')
-
-                        topics.append(topic_to_add)
-                elif file_.endswith('index-flat.csv'):
-                    print('Processing flat index CSV')
-                    parent_groups = []
-                    for row in reader:
-                        parent_groups.append(row[0])
-                        topics.append(f'{root2}/{row[0]}/{row[1]}')
-
-                    for parent_group in set(parent_groups):
-                        topics.append(f'{root2}/{parent_group}')
-
-with open('topic-hierarchy/earth-system-discipline.csv', 'w') as fh:
-    fieldnames = ['Name']
-    writer = csv.DictWriter(fh, fieldnames=fieldnames)
-    writer.writeheader()
-
-    for topic in sorted(topics):
-        writer.writerow({'Name': topic})
+import argparse
+from pathlib import Path
+
+from bundle import (JSON_FILE, OUTPUTS, SQLITE_FILE, TOPICS_CSV,
+                    write_json, write_sqlite, write_topics_csv)
+from hierarchy import load
+import instrumentation
+from topic_snapshot import SNAPSHOT_FILE, write_snapshot
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--report', type=Path,
+                    help='File to write a JSON report of timings and counters to')  # noqa
+parser.add_argument('--profile', type=Path,
+                    help='File to write a cProfile dump of the hot paths to')
+args = parser.parse_args()
+
+if args.profile is not None:
+    instrumentation.recorder.enable_profiling()
+
+with instrumentation.phase('load'):
+    hierarchy = load(Path.cwd())
+
+for source in hierarchy.sources:
+    if source.endswith('index.csv'):
+        print(f'Processed hierarchical index CSV {source}')
+    elif source.endswith('index-flat.csv'):
+        print(f'Processed flat index CSV {source}')
+
+with instrumentation.phase('csv'):
+    write_topics_csv(hierarchy, Path(TOPICS_CSV))
+
+print(f'Writing {SQLITE_FILE}')
+with instrumentation.phase('sqlite'):
+    write_sqlite(hierarchy, Path(SQLITE_FILE))
+
+print(f'Writing {JSON_FILE}')
+with instrumentation.phase('json'):
+    write_json(hierarchy, Path(JSON_FILE))
+
+print(f'Writing {SNAPSHOT_FILE}')
+with instrumentation.phase('snapshot'):
+    write_snapshot(hierarchy, Path(SNAPSHOT_FILE))
+
+for output in OUTPUTS:
+    instrumentation.increment('bundle.files')
+    instrumentation.increment('bundle.bytes', Path(output).stat().st_size)
+
+if args.report is not None:
+    instrumentation.recorder.write_report(args.report, 'generate-bundle.py')
+if args.profile is not None:
+    instrumentation.recorder.write_profile(args.profile)
@@ -0,0 +1,509 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+import csv
+import hashlib
+from pathlib import Path
+import re
+from typing import Iterator
+
+import instrumentation
+
+DESCRIPTION_SUFFIX = '-description'
+SOURCE_COLUMN = 'Source'
+TOPIC_HIERARCHY_CSV = 'topic-hierarchy.csv'
+CSV_DIR = 'topic-hierarchy'
+TREE_LEVEL = 'earth-system-discipline'
+
+
+class Node:
+    """
+    Node of the WIS2 Topic Hierarchy: the topic-hierarchy register, a level,
+    a codelist entry or a Level 7+ topic
+    """
+
+    __slots__ = ('name', 'description', 'source', 'status', 'register',
+                 'origin', 'parent', 'children')
+
+    def __init__(self, name: str, description: str = '', source: str = '',
+                 status: str = '', register: bool = False,
+                 origin: str = None) -> None:
+        """
+        Initialize a node
+
+        :param name: identifier of the node
+        :param description: description of the node
+        :param source: source of the definition, if any
+        :param status: status, 'Operational', 'Retired', etc.
+        :param register: `True` if the node is a (sub-)register
+        :param origin: path of the CSV file defining the node, relative to
+                       the root of the repository
+
+        :returns: `None`
+        """
+
+        self.name = name
+        self.description = description
+        self.source = source
+        self.status = status
+        self.register = register
+        self.origin = origin
+        self.parent = None
+        self.children = {}
+
+    def __repr__(self) -> str:
+        return f'<Node {self.path}>'
+
+    def __getstate__(self) -> tuple:
+        # the parent is left out so that a subtree can be pickled on its own
+        return (self.name, self.description, self.source, self.status,
+                self.register, self.origin, self.children)
+
+    def __setstate__(self, state: tuple) -> None:
+        (self.name, self.description, self.source, self.status,
+         self.register, self.origin, self.children) = state
+        self.parent = None
+        for child in self.children.values():
+            child.parent = self
+
+    def add(self, child: 'Node') -> 'Node':
+        """
+        Add a child, unless a child with the same name already exists
+
+        :param child: `Node` to add
+
+        :returns: `Node` of the child with that name
+        """
+
+        existing = self.children.get(child.name)
+        if existing is not None:
+            return existing
+
+        child.parent = self
+        self.children[child.name] = child
+
+        return child
+
+    @property
+    def path(self) -> str:
+        """
+        Path of the node, relative to the root of the hierarchy
+        (e.g. `earth-system-discipline/weather/aviation`)
+        """
+
+        names = []
+        node = self
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+
+        return '/'.join(reversed(names))
+
+    def walk(self, prefix: str = '') -> Iterator[tuple[str, 'Node']]:
+        """
+        Generate all descendants of the node, depth first, in definition
+        order
+
+        :param prefix: path prefix of the children (with trailing `/`)
+
+        :returns: iterator of (path, `Node`) `tuple`s, where path is
+                  relative to this node
+        """
+
+        for child in self.children.values():
+            path = f'{prefix}{child.name}'
+            yield path, child
+            yield from child.walk(f'{path}/')
+
+
+class Hierarchy:
+    """
+    WIS2 Topic Hierarchy, with the digest of every CSV file it was read from
+    """
+
+    def __init__(self, root: Node, sources: dict) -> None:
+        """
+        Initialize a hierarchy
+
+        :param root: `Node` of the topic-hierarchy register
+        :param sources: `dict` of SHA-256 digests of the CSV files read,
+                        by path relative to the root of the repository
+
+        :returns: `None`
+        """
+
+        self.root = root
+        self.sources = sources
+
+    @property
+    def levels(self) -> list[Node]:
+        """Level nodes (channel to earth-system-discipline), in order"""
+
+        return list(self.root.children.values())
+
+    @property
+    def tree(self) -> Node:
+        """Node of the earth-system-discipline level"""
+
+        return self.root.children[TREE_LEVEL]
+
+
+def read_csv(csv_file_path: Path, root_path: Path,
+             sources: dict) -> tuple[str, Iterator[str]]:
+    """
+    Open a CSV file for streaming, recording its digest once fully read
+
+    :param csv_file_path: path of the CSV file
+    :param root_path: root of the repository
+    :param sources: `dict` of digests, updated with the CSV file
+
+    :returns: `tuple` of the path of the CSV file relative to the root of
+              the repository and an iterator of its lines, to be passed
+              to `csv.reader` or `csv.DictReader`
+    """
+
+    origin = csv_file_path.relative_to(root_path).as_posix()
+
+    return origin, _read_lines(csv_file_path, origin, sources)
+
+
+def _read_lines(csv_file_path: Path, origin: str,
+                sources: dict) -> Iterator[str]:
+    digest = hashlib.sha256()
+    size = 0
+
+    # no newline translation, so that the digest is the one of the file
+    with csv_file_path.open(encoding='utf-8', newline='') as fh:
+        for line in fh:
+            data = line.encode('utf-8')
+            digest.update(data)
+            size += len(data)
+            yield line
+
+    sources[origin] = digest.hexdigest()
+    instrumentation.increment('csv.files')
+    instrumentation.increment('csv.bytes', size)
+
+
+def read_flat_index_keys(keys: list[str]) -> tuple[list[str], list[str]]:
+    """
+    Split the columns of an index-flat.csv file (without the trailing
+    status column) into name and description columns
+
+    :param keys: column names
+
+    :returns: `tuple` of name keys and description keys
+    """
+
+    if len(keys) % 2 != 0 or len(keys) == 0:
+        raise RuntimeError(f'Unexpected number of columns {len(keys)}')
+    description_regex = re.compile(r'\w+' + DESCRIPTION_SUFFIX)
+    description_keys = [k for k in keys if description_regex.match(k)]
+    name_keys = [k for k in keys if not description_regex.match(k)]
+    if len(description_keys) != len(name_keys):
+        raise RuntimeError(
+            f'Unexpected number of description columns {len(description_keys)}'
+        )
+    return (name_keys, description_keys)
+
+
+def read_subdomain_index(node: Node, csv_dir: Path, root_path: Path,
+                         sources: dict) -> None:
+    """
+    Reads recursively the index.csv or index-flat.csv file of csv_dir into
+    the children of node
+
+    Rows of an index.csv file with a sub-directory of the same name are
+    sub-registers, other rows are leaves.  Each level of an index-flat.csv
+    file is described by two columns, "X" containing the name and
+    "X-description" containing the description; columns/levels are
+    processed from left to right and all but the last are sub-registers.
+
+    :param node: `Node` to add the children to
+    :param csv_dir: directory containing the index file
+    :param root_path: root of the repository
+    :param sources: `dict` of digests, updated with the CSV files read
+
+    :returns: `None`
+    """
+
+    index_file_path = csv_dir / 'index.csv'
+    flat_index_file_path = csv_dir / 'index-flat.csv'
+
+    if index_file_path.exists():
+        origin, lines = read_csv(index_file_path, root_path, sources)
+        for record in csv.DictReader(lines, restval=''):
+            csv_sub_dir = csv_dir / record['Name']
+            child = node.add(Node(
+                record['Name'], record['Description'], record['Source'],
+                record['Status'], csv_sub_dir.exists(), origin
+            ))
+            if child.register:
+                read_subdomain_index(child, csv_sub_dir, root_path, sources)
+    elif flat_index_file_path.exists():
+        origin, lines = read_csv(flat_index_file_path, root_path, sources)
+        read_flat_subdomain_index(node, origin, csv.reader(lines))
+
+
+@instrumentation.profiled
+def read_flat_subdomain_index(node: Node, origin: str,
+                              reader: csv.reader) -> None:
+    """
+    Reads an index-flat.csv file into the children of node, in a single
+    streaming pass over its rows
+
+    Column positions are resolved once from the header.  The last column
+    is the status of the leaves, which may also have an optional "Source"
+    column; the upper levels have neither.  The nodes of the
+    previous row are kept, one per level, so that consecutive rows sharing
+    their upper levels (the usual, sorted, layout) only look up the levels
+    which differ; rows do not need to be sorted though.  Only the nodes are
+    kept in memory, whatever the number of rows.
+
+    :param node: `Node` to add the children to
+    :param origin: path of the CSV file, relative to the repository root
+    :param reader: `csv.reader` of the file, positioned at the header
+
+    :returns: `None`
+    """
+
+    header = next(reader, None)
+    if header is None:
+        return
+
+    keys = header[:-1]
+    source_column = None
+    if SOURCE_COLUMN in keys:
+        source_column = header.index(SOURCE_COLUMN)
+        keys = [key for key in keys if key != SOURCE_COLUMN]
+
+    name_keys, _ = read_flat_index_keys(keys)
+    try:
+        columns = [(header.index(name_key),
+                    header.index(name_key + DESCRIPTION_SUFFIX))
+                   for name_key in name_keys]
+    except ValueError as err:
+        raise RuntimeError(f'Missing description column in {origin}: {err}')
+
+    status_column = len(header) - 1
+    leaf_level = len(columns) - 1
+    current = []
+
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < status_column:
+            raise RuntimeError(
+                f'Unexpected number of columns in {origin} '
+                f'line {reader.line_num}'
+            )
+
+        parent = node
+        for level, (name_column, description_column) in enumerate(columns):
+            name = row[name_column]
+            if level < len(current) and current[level].name == name:
+                parent = current[level]
+                continue
+
+            del current[level:]
+            child = parent.children.get(name)
+            if child is None:
+                is_leaf = level == leaf_level
+                source = status = ''
+                if is_leaf and len(row) > status_column:
+                    status = row[status_column]
+                if is_leaf and source_column is not None:
+                    source = row[source_column]
+                child = parent.add(Node(
+                    name, row[description_column], source, status,
+                    not is_leaf, origin
+                ))
+            current.append(child)
+            parent = child
+
+
+def read_codelist(level: Node, root_path: Path, sources: dict) -> None:
+    """
+    Reads the codelist CSV file of a level (1-6) into its children
+
+    :param level: `Node` of the level
+    :param root_path: root of the repository
+    :param sources: `dict` of digests, updated with the CSV file
+
+    :returns: `None`
+    """
+
+    origin, lines = read_csv(root_path / CSV_DIR / f'{level.name}.csv',
+                             root_path, sources)
+    for record in csv.DictReader(lines, restval=''):
+        level.add(Node(
+            record['Name'], record['Description'], record['Source'],
+            record['Status'], False, origin
+        ))
+
+
+def load(root_path: Path) -> Hierarchy:
+    """
+    Load the topic hierarchy from a repository checkout, reading each
+    CSV file exactly once
+
+    :param root_path: directory containing `topic-hierarchy.csv` and
+                      the `topic-hierarchy` directory
+
+    :returns: `Hierarchy` of the repository
+    """
+
+    sources = {}
+    csv_files_path = root_path / CSV_DIR
+    root = Node('topic-hierarchy', 'WIS2 Topic Hierarchy', register=True)
+
+    origin, lines = read_csv(root_path / TOPIC_HIERARCHY_CSV, root_path,
+                             sources)
+    for record in csv.DictReader(lines, restval=''):
+        level = root.add(Node(
+            record['Name'], record['Description'], record['Source'],
+            record['Status'], True, origin
+        ))
+
+        if level.name == TREE_LEVEL:
+            read_subdomain_index(level, csv_files_path / TREE_LEVEL,
+                                 root_path, sources)
+            continue
+
+        read_codelist(level, root_path, sources)
+
+    return Hierarchy(root, sources)
+
+
+def reload_target(model: Hierarchy, root_path: Path, path: str) -> Node:
+    """
+    Find the smallest subtree to read again after a change to a file or
+    directory
+
+    An index file defines the children of its directory's node.  Creating
+    or deleting one, or a directory, changes whether the directory's node
+    is a sub-register, i.e. a row of the parent's index file.
+
+    :param model: loaded `Hierarchy`
+    :param root_path: root of the repository
+    :param path: path of the changed CSV file or directory, relative to
+                 `root_path`
+
+    :returns: `Node` of the subtree (the root if the whole hierarchy is to
+              be loaded again), or `None` if the path does not define
+              any node
+    """
+
+    tree_dir = f'{CSV_DIR}/{TREE_LEVEL}'
+
+    if path in ('', '.', TOPIC_HIERARCHY_CSV, CSV_DIR):
+        return model.root
+
+    if path != tree_dir and not path.startswith(f'{tree_dir}/'):
+        directory, _, name = path.rpartition('/')
+        level = model.root.children.get(name.removesuffix('.csv'))
+        if directory != CSV_DIR or not name.endswith('.csv') or \
+                level is None or level.name == TREE_LEVEL:
+            return None
+        return level
+
+    directory, _, name = path.rpartition('/')
+    if name in ('index.csv', 'index-flat.csv'):
+        if path not in model.sources or not (root_path / path).exists():
+            directory = directory.rpartition('/')[0]
+    elif name.endswith('.csv'):
+        return None
+
+    node = model.tree
+    for name in directory.split('/')[2:]:
+        child = node.children.get(name)
+        if child is None or not child.register:
+            break
+        node = child
+
+    return node
+
+
+@instrumentation.profiled
+def reload(model: Hierarchy, root_path: Path,
+           changes: set[str]) -> list[tuple[Node, Node]]:
+    """
+    Read again the CSV files affected by changes into a loaded hierarchy,
+    replacing the smallest subtrees defined by them
+
+    All the CSV files are read before any subtree is replaced, so that the
+    hierarchy is left as it was if one of them cannot be read.
+
+    :param model: `Hierarchy` to update in place
+    :param root_path: root of the repository
+    :param changes: paths of the changed CSV files and directories,
+                    relative to `root_path`
+
+    :returns: `list` of (old, new) `Node`s of the replaced subtrees
+    """
+
+    targets = {}
+    for path in changes:
+        node = reload_target(model, root_path, path)
+        if node is not None:
+            targets[id(node)] = node
+
+    if id(model.root) in targets:
+        old = model.root
+        reloaded = load(root_path)
+        model.root, model.sources = reloaded.root, reloaded.sources
+        return [(old, model.root)]
+
+    # subtrees below another one are read with it
+    subtrees = []
+    for node in targets.values():
+        ancestor = node.parent
+        while ancestor is not None and id(ancestor) not in targets:
+            ancestor = ancestor.parent
+        if ancestor is None:
+            subtrees.append(node)
+
+    sources = {}
+    replaced = []
+    for old in subtrees:
+        new = Node(old.name, old.description, old.source, old.status,
+                   old.register, old.origin)
+        if old.parent is model.root and old.name != TREE_LEVEL:
+            read_codelist(new, root_path, sources)
+        else:
+            read_subdomain_index(new, root_path / CSV_DIR / old.path,
+                                 root_path, sources)
+        replaced.append((old, new))
+
+    for old, new in replaced:
+        if old.parent is model.root and old.name != TREE_LEVEL:
+            del model.sources[f'{CSV_DIR}/{old.name}.csv']
+        else:
+            prefix = f'{CSV_DIR}/{old.path}/'
+            for source in [s for s in model.sources if s.startswith(prefix)]:
+                del model.sources[source]
+        # the parent keeps its order of children
+        new.parent = old.parent
+        old.parent.children[old.name] = new
+
+    model.sources.update(sources)
+
+    return replaced
@@ -0,0 +1,245 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+import argparse
+import io
+import json
+from pathlib import Path
+import subprocess
+import tarfile
+import tempfile
+
+import hierarchy
+from topic_suggest import levenshtein
+
+RETIRED = 'Retired'
+# attributes of a node compared between versions
+FIELDS = ('description', 'source', 'status', 'register')
+
+
+def load_revision(repo_path: Path, revision: str) -> hierarchy.Hierarchy:
+    """
+    Load the topic hierarchy of a git revision, without checking it out
+
+    :param repo_path: root of the git repository
+    :param revision: git revision (commit, branch, tag)
+
+    :returns: `Hierarchy` of the revision
+    """
+
+    try:
+        result = subprocess.run(
+            ['git', '-C', str(repo_path), 'archive', '--format=tar',
+             revision, hierarchy.TOPIC_HIERARCHY_CSV, hierarchy.CSV_DIR],
+            check=True, capture_output=True)
+    except subprocess.CalledProcessError as err:
+        raise RuntimeError(f'Cannot read revision {revision}: '
+                           f'{err.stderr.decode().strip()}')
+
+    with tempfile.TemporaryDirectory(prefix='.wth-') as tmp:
+        with tarfile.open(fileobj=io.BytesIO(result.stdout)) as tar:
+            tar.extractall(tmp, filter='data')
+        return hierarchy.load(Path(tmp))
+
+
+def load_version(version: str, repo_path: Path) -> hierarchy.Hierarchy:
+    """
+    Load a version of the topic hierarchy
+
+    :param version: directory of a checkout, or git revision
+    :param repo_path: root of the git repository, for revisions
+
+    :returns: `Hierarchy` of the version
+    """
+
+    path = Path(version)
+    if (path / hierarchy.TOPIC_HIERARCHY_CSV).exists():
+        return hierarchy.load(path)
+
+    return load_revision(repo_path, version)
+
+
+def parent_path(path: str) -> str:
+    """
+    Path of the parent of a node
+
+    :param path: path of the node (e.g. `earth-system-discipline/weather`)
+
+    :returns: `str` of the path of the parent (empty for levels)
+    """
+
+    return path.rpartition('/')[0]
+
+
+def compare_nodes(old: hierarchy.Node, new: hierarchy.Node) -> dict:
+    """
+    Compare the attributes of two versions of a node
+
+    :param old: `Node` of the old version
+    :param new: `Node` of the new version
+
+    :returns: `dict` of [old, new] values of the changed attributes
+    """
+
+    return {field: [getattr(old, field), getattr(new, field)]
+            for field in FIELDS if getattr(old, field) != getattr(new, field)}
+
+
+def diff(old: hierarchy.Hierarchy, new: hierarchy.Hierarchy) -> dict:
+    """
+    Compare two versions of the topic hierarchy
+
+    Nodes are matched by path.  A removed node is taken as renamed into an
+    added node of the same (possibly renamed) parent with the same
+    description, the closest name winning; the descendants of a renamed
+    node follow it.
+
+    :param old: `Hierarchy` of the old version
+    :param new: `Hierarchy` of the new version
+
+    :returns: `dict` of added, removed, renamed, retired and changed
+              nodes, and of the registers whose subtrees are affected
+    """
+
+    old_nodes = dict(old.root.walk())
+    new_nodes = dict(new.root.walk())
+
+    added = {path: None for path in new_nodes if path not in old_nodes}
+    removed = [path for path in old_nodes if path not in new_nodes]
+
+    candidates = {}
+    for path in added:
+        description = new_nodes[path].description
+        if description:
+            candidates.setdefault((parent_path(path), description),
+                                  []).append(path)
+
+    # parents come before their children in walk order
+    renames = {}
+    renamed = []
+    for path in removed:
+        parent, _, name = path.rpartition('/')
+        new_parent = renames.get(parent, parent)
+        if parent in renames and f'{new_parent}/{name}' in added:
+            renames[path] = f'{new_parent}/{name}'
+        else:
+            key = (new_parent, old_nodes[path].description)
+            matches = [match for match in candidates.get(key, ())
+                       if match in added]
+            if not matches:
+                continue
+            renames[path] = min(matches, key=lambda match: levenshtein(
+                name, match.rpartition('/')[2]))
+            renamed.append({'old': path, 'new': renames[path]})
+        del added[renames[path]]
+
+    changed = []
+    retired = []
+    pairs = [(path, path) for path in old_nodes if path in new_nodes]
+    pairs.extend(renames.items())
+    for old_path, new_path in pairs:
+        changes = compare_nodes(old_nodes[old_path], new_nodes[new_path])
+        if not changes:
+            continue
+        changed.append({'path': new_path, 'changes': changes})
+        if 'status' in changes and changes['status'][1] == RETIRED:
+            retired.append(new_path)
+
+    removed = [path for path in removed if path not in renames]
+
+    # registers whose TTL files are to be regenerated: the parents of the
+    # added, removed and renamed nodes (membership) and of the changed ones
+    affected = set()
+    affected.update(parent_path(path) for path in added)
+    affected.update(parent_path(path) for path in removed)
+    affected.update(parent_path(rename['new']) for rename in renamed)
+    affected.update(parent_path(change['path']) for change in changed)
+
+    return {
+        'added': list(added),
+        'removed': removed,
+        'renamed': renamed,
+        'retired': retired,
+        'changed': changed,
+        'affected': minimal_prefixes(affected)
+    }
+
+
+def minimal_prefixes(paths: set[str]) -> list[str]:
+    """
+    Reduce paths to those not below another one
+
+    :param paths: `set` of paths
+
+    :returns: sorted `list` of paths
+    """
+
+    result = []
+    for path in sorted(paths):
+        if result and (result[-1] == '' or path.startswith(f'{result[-1]}/')):
+            continue
+        result.append(path)
+
+    return result
+
+
+def format_text(result: dict) -> str:
+    """
+    Format the result of `diff` as one line per change
+
+    :param result: `dict` returned by `diff`
+
+    :returns: `str` of the changes
+    """
+
+    lines = [f'+ {path}' for path in result['added']]
+    lines.extend(f'- {path}' for path in result['removed'])
+    lines.extend(f'R {rename["old"]} -> {rename["new"]}'
+                 for rename in result['renamed'])
+    for change in result['changed']:
+        for field, (old, new) in change['changes'].items():
+            lines.append(f'~ {change["path"]} {field}: {old!r} -> {new!r}')
+
+    return ''.join(f'{line}\n' for line in lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare two versions of the WIS2 Topic Hierarchy')
+    parser.add_argument('old',
+                        help='Directory of a checkout, or git revision')
+    parser.add_argument('new', nargs='?', default='.',
+                        help='Directory of a checkout, or git revision (default: working tree)')  # noqa
+    parser.add_argument('-r', '--root', default='.', type=Path,
+                        help='Root of the git repository, for revisions')
+    parser.add_argument('-f', '--format', choices=['json', 'text'],
+                        default='json', help='Output format')
+
+    args = parser.parse_args()
+
+    result = diff(load_version(args.old, args.root),
+                  load_version(args.new, args.root))
+
+    if args.format == 'json':
+        print(json.dumps(result, indent=2))
+    else:
+        print(format_text(result), end='')
@@ -0,0 +1,305 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+import instrumentation
+
+POOL_SIZE = 10
+RETRIES = 3
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+MAX_RETRY_AFTER = 120
+TIMEOUT = 60
+RATE = 10
+RATE_INCREASE = 5
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+# requests refused before being processed, safe to retry whatever the verb
+REFUSED_STATUSES = {429, 503}
+# transient errors, only retried for idempotent requests
+TRANSIENT_STATUSES = {500, 502, 504}
+
+
+class RateLimiter:
+    """
+    Token bucket pacing requests, whose rate adapts to the throttling of
+    the server (additive increase, multiplicative decrease)
+
+    Every successful request raises the rate so that it grows by
+    `increase` requests per second every second; a throttled request cuts
+    it by `decrease` (at most once per `cooldown` seconds, as concurrent
+    requests are throttled together) and pauses the bucket for the delay
+    asked by the server, if any.
+    """
+
+    def __init__(self, rate: float, min_rate: float = 1,
+                 max_rate: float = None, increase: float = RATE_INCREASE,
+                 decrease: float = 0.5, cooldown: float = 1) -> None:
+        """
+        Initialize a rate limiter
+
+        :param rate: initial rate, in requests per second
+        :param min_rate: minimum rate
+        :param max_rate: optional maximum rate
+        :param increase: rate increase per second without throttling
+        :param decrease: factor applied to the rate when throttled
+        :param cooldown: minimum time between two decreases, in seconds
+
+        :returns: `None`
+        """
+
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._tokens = 1.0
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._decreased = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take a token, waiting for one to be available
+
+        :returns: `float` of the time waited, in seconds
+        """
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    # one token of burst: requests are evenly paced
+                    self._tokens = min(1.0, self._tokens +
+                                       (now - self._refilled) * self.rate)
+                    self._refilled = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    delay = (1 - self._tokens) / self.rate
+                else:
+                    delay = self._paused_until - now
+            time.sleep(delay)
+            waited += delay
+
+    def succeeded(self) -> None:
+        """
+        Record a request which was not throttled
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            self.rate += self.increase / self.rate
+            if self.max_rate is not None:
+                self.rate = min(self.rate, self.max_rate)
+
+    def throttled(self, retry_after: float = None) -> None:
+        """
+        Record a throttled request
+
+        :param retry_after: optional delay asked by the server, in seconds
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._decreased >= self.cooldown:
+                self._decreased = now
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                instrumentation.increment('http.rate.decrease')
+            if retry_after:
+                self._paused_until = max(self._paused_until,
+                                         now + retry_after)
+                self._tokens = 0.0
+                self._refilled = self._paused_until
+
+
+def not_sent(err: requests.ConnectionError) -> bool:
+    """
+    Check whether a connection error happened before the request was sent
+
+    :param err: connection error
+
+    :returns: `True` if the connection could not be established
+    """
+
+    if isinstance(err, requests.ConnectTimeout):
+        return True
+    reason = err.args[0] if err.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+
+    return isinstance(reason, NewConnectionError)
+
+
+def retry_after(response: requests.Response) -> float:
+    """
+    Get the delay asked by the server before retrying
+
+    :param response: response
+
+    :returns: `float` of the delay in seconds (0 if none)
+    """
+
+    value = response.headers.get('Retry-After')
+    if not value:
+        return 0.0
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+    return max(0.0, date.timestamp() - time.time())
+
+
+class RegistrySession(requests.Session):
+    """
+    `requests.Session` with a sized pool of kept-alive connections,
+    retries with jittered exponential backoff and adaptive rate limiting
+
+    Requests refused by the server (429, 503) are retried whatever the
+    verb, after the delay it asked for if longer than the backoff, and
+    slow the rate limiter down (unless a 503 without `Retry-After`); a
+    request asking for more than `max_retry_after` seconds is not retried;
+    transient errors (500, 502, 504, connection errors and timeouts) are
+    only retried for idempotent verbs, as a POST may have been processed.
+    A connection which could not be established is retried in any case.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, retries: int = RETRIES,
+                 backoff: float = BACKOFF, max_backoff: float = MAX_BACKOFF,
+                 timeout: float = TIMEOUT,
+                 limiter: RateLimiter = None,
+                 max_retry_after: float = MAX_RETRY_AFTER) -> None:
+        """
+        Initialize a session
+
+        :param pool_size: number of connections kept alive per host
+                          (at least the number of concurrent requests)
+        :param retries: maximum number of retries of a request
+        :param backoff: base delay of the exponential backoff, in seconds
+        :param max_backoff: maximum delay of the backoff, in seconds
+        :param timeout: default timeout of the requests, in seconds
+        :param limiter: optional `RateLimiter` pacing the requests
+        :param max_retry_after: maximum `Retry-After` delay waited for, in
+                                seconds
+
+        :returns: `None`
+        """
+
+        super().__init__()
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              pool_block=True)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.limiter = limiter
+        self.max_retry_after = max_retry_after
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Compute the delay before a retry ("full jitter")
+
+        :param attempt: number of the attempt which failed, from 0
+
+        :returns: `float` of the delay in seconds
+        """
+
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, method: str, url: str,
+                **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire()
+
+            try:
+                response = super().request(method, url, **kwargs)
+            except requests.ConnectionError as err:
+                if attempt >= self.retries or \
+                        not (idempotent or not_sent(err)):
+                    raise
+                delay = self.backoff_delay(attempt)
+            except requests.Timeout:
+                if attempt >= self.retries or not idempotent:
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                status = response.status_code
+                if status in REFUSED_STATUSES:
+                    delay = retry_after(response)
+                    # a longer delay would stall the workers: the request
+                    # fails instead of waiting
+                    exceeded = delay > self.max_retry_after
+                    delay = min(delay, self.max_retry_after)
+                    # an unavailable server without a delay to wait for
+                    # is not taken as throttling
+                    if self.limiter is not None and \
+                            (status == 429 or delay):
+                        self.limiter.throttled(delay)
+                    if exceeded:
+                        instrumentation.increment('http.retry_after.exceeded')
+                        return response
+                    delay = max(delay, self.backoff_delay(attempt))
+                elif status in TRANSIENT_STATUSES and idempotent:
+                    delay = self.backoff_delay(attempt)
+                else:
+                    if self.limiter is not None:
+                        self.limiter.succeeded()
+                    return response
+                if attempt >= self.retries:
+                    return response
+                instrumentation.increment(f'http.retry.{status}')
+                response.close()
+
+            instrumentation.increment('http.retries')
+            attempt += 1
+            time.sleep(delay)
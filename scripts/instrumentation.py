@@ -0,0 +1,339 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+import contextlib
+import cProfile
+from datetime import datetime, timezone
+import functools
+import json
+from pathlib import Path
+import pstats
+import threading
+import time
+from typing import Callable, Iterator
+
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Recorder:
+    """
+    Phase timings, counters and latency histograms of a run, safe to
+    update from several threads
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize an empty recorder
+
+        :returns: `None`
+        """
+
+        self.started = datetime.now(timezone.utc)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.phases = {}
+        self.counters = {}
+        self.histograms = {}
+        self.profile_stats = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        """
+        Forget the phases, counters and histograms recorded so far
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            self.phases = {}
+            self.counters = {}
+            self.histograms = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time a phase (wall and thread CPU time); phases running in several
+        threads or called several times add up
+
+        :param name: name of the phase
+
+        :returns: context manager
+        """
+
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start_wall
+            cpu_time = time.thread_time() - start_cpu
+            with self._lock:
+                phase = self.phases.setdefault(
+                    name, {'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0})
+                phase['calls'] += 1
+                phase['wall_time'] += wall_time
+                phase['cpu_time'] += cpu_time
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """
+        Increment a counter
+
+        :param name: name of the counter
+        :param value: increment
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Add a duration to a latency histogram
+
+        :param name: name of the histogram
+        :param seconds: duration
+
+        :returns: `None`
+        """
+
+        milliseconds = seconds * 1000
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {
+                    'count': 0, 'sum_ms': 0.0, 'min_ms': milliseconds,
+                    'max_ms': milliseconds, 'buckets': [0] * (len(BUCKETS) + 1)
+                }
+            histogram['count'] += 1
+            histogram['sum_ms'] += milliseconds
+            histogram['min_ms'] = min(histogram['min_ms'], milliseconds)
+            histogram['max_ms'] = max(histogram['max_ms'], milliseconds)
+            for i, bound in enumerate(BUCKETS):
+                if milliseconds <= bound:
+                    break
+            else:
+                i = len(BUCKETS)
+            histogram['buckets'][i] += 1
+
+    def enable_profiling(self) -> None:
+        """
+        Profile the functions decorated with `profiled` from now on
+
+        :returns: `None`
+        """
+
+        self.profile_stats = []
+
+    def run_profiled(self, func: Callable, *args, **kwargs):
+        """
+        Call a function, under cProfile if profiling is enabled and the
+        current thread is not already profiled
+
+        :param func: function to call
+
+        :returns: result of the function
+        """
+
+        if self.profile_stats is None or \
+                getattr(self._local, 'profiling', False):
+            return func(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        self._local.profiling = True
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            self._local.profiling = False
+            with self._lock:
+                self.profile_stats.append(profile)
+
+    def snapshot(self) -> dict:
+        """
+        Get the phases, counters and histograms recorded so far
+
+        :returns: `dict` of the phases, counters and histograms
+        """
+
+        with self._lock:
+            return json.loads(json.dumps({
+                'phases': self.phases,
+                'counters': self.counters,
+                'histograms': self.histograms
+            }))
+
+    def merge(self, snapshot: dict) -> None:
+        """
+        Add the phases, counters and histograms of another recorder, e.g.
+        of a worker process
+
+        :param snapshot: `dict` returned by `snapshot`
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            for name, phase in snapshot['phases'].items():
+                total = self.phases.setdefault(
+                    name, {'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0})
+                for key in total:
+                    total[key] += phase[key]
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, histogram in snapshot['histograms'].items():
+                total = self.histograms.get(name)
+                if total is None:
+                    self.histograms[name] = histogram
+                    continue
+                total['count'] += histogram['count']
+                total['sum_ms'] += histogram['sum_ms']
+                total['min_ms'] = min(total['min_ms'], histogram['min_ms'])
+                total['max_ms'] = max(total['max_ms'], histogram['max_ms'])
+                total['buckets'] = [a + b for a, b in zip(
+                    total['buckets'], histogram['buckets'])]
+
+    def report(self, script: str) -> dict:
+        """
+        Build the report of the run
+
+        :param script: name of the script
+
+        :returns: `dict` of the report
+        """
+
+        report = {
+            'script': script,
+            'started': self.started.isoformat(),
+            'wall_time': round(time.perf_counter() - self.start_wall, 6),
+            'cpu_time': round(time.process_time() - self.start_cpu, 6)
+        }
+        report.update(self.snapshot())
+
+        for phase in report['phases'].values():
+            phase['wall_time'] = round(phase['wall_time'], 6)
+            phase['cpu_time'] = round(phase['cpu_time'], 6)
+        for histogram in report['histograms'].values():
+            histogram['mean_ms'] = round(
+                histogram['sum_ms'] / histogram['count'], 3)
+            histogram['buckets'] = {
+                f'le_{bound}': count for bound, count in zip(
+                    [*BUCKETS, 'inf'], histogram['buckets'])
+            }
+
+        return report
+
+    def write_report(self, path: Path, script: str) -> None:
+        """
+        Write the report of the run as JSON
+
+        :param path: `pathlib.Path` of the report
+        :param script: name of the script
+
+        :returns: `None`
+        """
+
+        with path.open('w', encoding='utf-8') as fh:
+            json.dump(self.report(script), fh, indent=1)
+
+    def write_profile(self, path: Path) -> None:
+        """
+        Write the combined cProfile statistics of the profiled calls, to be
+        read with `pstats` or tools such as snakeviz
+
+        :param path: `pathlib.Path` of the dump
+
+        :returns: `None`
+        """
+
+        if not self.profile_stats:
+            return
+
+        stats = pstats.Stats(self.profile_stats[0])
+        for profile in self.profile_stats[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+
+
+recorder = Recorder()
+phase = recorder.phase
+increment = recorder.increment
+observe = recorder.observe
+
+
+def profiled(func: Callable) -> Callable:
+    """
+    Decorate a hot path to be profiled when profiling is enabled
+
+    :param func: function to decorate
+
+    :returns: decorated function
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return recorder.run_profiled(func, *args, **kwargs)
+
+    return wrapper
+
+
+def request(session, method: str, url: str, **kwargs):
+    """
+    Send an HTTP request, counting it by verb and status and recording its
+    latency
+
+    :param session: `requests.Session` (or compatible)
+    :param method: HTTP verb (GET, POST, PUT)
+    :param url: URL of the request
+
+    :returns: response
+    """
+
+    start = time.perf_counter()
+    try:
+        response = getattr(session, method.lower())(url, **kwargs)
+    except Exception:
+        recorder.increment(f'http.{method}.error')
+        raise
+    finally:
+        recorder.observe(f'http.{method}', time.perf_counter() - start)
+
+    recorder.increment(f'http.{method}.{response.status_code}')
+
+    return response
+
+
+def run_collected(func: Callable, *args, **kwargs) -> tuple:
+    """
+    Call a function in a worker process, collecting what it recorded
+
+    :param func: function to call
+
+    :returns: `tuple` of the result of the function and the snapshot of
+              the worker recorder, to be merged with `recorder.merge`
+    """
+
+    # worker processes inherit the state of the parent and are reused
+    recorder.reset()
+
+    return func(*args, **kwargs), recorder.snapshot()
@@ -0,0 +1,400 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+import argparse
+from pathlib import Path
+import sys
+from typing import Hashable, Iterable
+
+import topic_trie
+from topic_trie import MULTI_LEVEL_WILDCARD, SINGLE_LEVEL_WILDCARD
+from topic_validator import METADATA, NOTIFICATION_TYPE_LEVEL, read_topics
+
+
+class RouteNode:
+    """
+    Level of the subscription trie: the children by value, the single-level
+    wildcard branch and the subscriptions ending at this level
+    """
+
+    __slots__ = ('children', 'any', 'subscribers', 'rest')
+
+    def __init__(self) -> None:
+        self.children = {}
+        # child of the `+` branch, if any
+        self.any = None
+        # subscribers of the pattern ending at this level, and of the
+        # pattern ending with `#` below it
+        self.subscribers = set()
+        self.rest = set()
+
+    def __bool__(self) -> bool:
+        return bool(self.children or self.any or self.subscribers or
+                    self.rest)
+
+
+class SubscriptionRouter:
+    """
+    Index of subscriptions to MQTT topic filters, matching published topics
+    to the subscribers of all the filters they match
+
+    Filters are stored in a trie with one level per topic level, where the
+    `+` wildcard is a branch of its own and `#` subscriptions are held by
+    the level they start from.  A topic is matched by walking its levels
+    once, following the literal and `+` branches from every node reached so
+    far, so that the time depends on the depth of the topic and on the
+    wildcard branches it meets, not on the number of subscriptions.
+    """
+
+    def __init__(self, trie: topic_trie.TopicTrie = None) -> None:
+        """
+        Initialize an empty router
+
+        :param trie: `TopicTrie` of the hierarchy, against which filters
+                     are checked when added (none if `None`)
+
+        :returns: `None`
+        """
+
+        self.trie = trie
+        self.root = RouteNode()
+        self.subscriptions = 0
+
+    def __len__(self) -> int:
+        return self.subscriptions
+
+    def can_match(self, pattern: str) -> bool:
+        """
+        Check whether a filter matches any topic of the hierarchy: a defined
+        topic, a metadata topic or a topic below an `experimental` one
+
+        :param pattern: MQTT topic filter
+
+        :returns: `bool` of whether the filter can match a topic
+        """
+
+        if self.trie is None or self.trie.count(pattern):
+            return True
+
+        segments = pattern.split('/')
+        depth = len(self.trie.levels)
+
+        # metadata is published at the notification-type level, above the
+        # topics counted by the trie
+        if len(segments) == NOTIFICATION_TYPE_LEVEL + 1 and \
+                segments[-1] in (METADATA, SINGLE_LEVEL_WILDCARD):
+            return all(
+                segment == SINGLE_LEVEL_WILDCARD or segment in allowed
+                for segment, allowed in zip(segments[:-1], self.trie.levels)
+            ) and METADATA in self.trie.levels[NOTIFICATION_TYPE_LEVEL]
+
+        # levels below experimental topics are not defined, but allowed;
+        # a `+` matches the level of the experimental topic it stands for
+        tree_segments = segments[depth:]
+        for experimental in self.trie.experimental:
+            names = experimental.split('/')
+            below = tree_segments[len(names):]
+            if not below or '' in below:
+                continue
+            if all(segment in (SINGLE_LEVEL_WILDCARD, name)
+                   for segment, name in zip(tree_segments, names)) and \
+                    self.trie.count('/'.join(segments[:depth] + names)):
+                return True
+
+        return False
+
+    def check(self, pattern: str) -> None:
+        """
+        Check a filter before it is added
+
+        :param pattern: MQTT topic filter
+
+        :returns: `None`; raises `ValueError` if the filter is invalid or
+                  can never match a topic of the hierarchy
+        """
+
+        segments = pattern.split('/')
+        for i, segment in enumerate(segments):
+            if segment == MULTI_LEVEL_WILDCARD:
+                if i != len(segments) - 1:
+                    raise ValueError(f'Invalid pattern {pattern}: '
+                                     f'{MULTI_LEVEL_WILDCARD} must be last')
+            elif segment != SINGLE_LEVEL_WILDCARD and (
+                    SINGLE_LEVEL_WILDCARD in segment or
+                    MULTI_LEVEL_WILDCARD in segment):
+                raise ValueError(f'Invalid pattern {pattern}: wildcards '
+                                 'must occupy an entire level')
+
+        if not self.can_match(pattern):
+            raise ValueError(f'Pattern {pattern} does not match any topic '
+                             'of the hierarchy')
+
+    def _insert(self, pattern: str, subscriber: Hashable) -> bool:
+        node = self.root
+        segments = pattern.split('/')
+        if segments[-1] == MULTI_LEVEL_WILDCARD:
+            segments.pop()
+            for segment in segments:
+                node = self._child(node, segment)
+            subscribers = node.rest
+        else:
+            for segment in segments:
+                node = self._child(node, segment)
+            subscribers = node.subscribers
+
+        if subscriber in subscribers:
+            return False
+        subscribers.add(subscriber)
+        self.subscriptions += 1
+
+        return True
+
+    @staticmethod
+    def _child(node: RouteNode, segment: str) -> RouteNode:
+        if segment == SINGLE_LEVEL_WILDCARD:
+            if node.any is None:
+                node.any = RouteNode()
+            return node.any
+
+        child = node.children.get(segment)
+        if child is None:
+            child = node.children[segment] = RouteNode()
+        return child
+
+    def add(self, pattern: str, subscriber: Hashable) -> bool:
+        """
+        Subscribe to a filter
+
+        :param pattern: MQTT topic filter (e.g. `cache/a/wis2/+/data/#`)
+        :param subscriber: identifier of the subscriber
+
+        :returns: `bool` of whether the subscription was added (`False` if
+                  it already existed); raises `ValueError` if the filter
+                  is invalid or can never match a topic of the hierarchy
+        """
+
+        self.check(pattern)
+        return self._insert(pattern, subscriber)
+
+    def add_batch(self, subscriptions: Iterable[tuple[str, Hashable]]
+                  ) -> list[tuple[str, Hashable, str]]:
+        """
+        Add many subscriptions, each distinct filter being checked once
+
+        :param subscriptions: iterable of (filter, subscriber) `tuple`s
+
+        :returns: `list` of (filter, subscriber, reason) `tuple`s of the
+                  rejected subscriptions, the others being added
+        """
+
+        errors = {}
+        rejected = []
+
+        for pattern, subscriber in subscriptions:
+            if pattern not in errors:
+                try:
+                    self.check(pattern)
+                    errors[pattern] = None
+                except ValueError as err:
+                    errors[pattern] = str(err)
+            if errors[pattern] is None:
+                self._insert(pattern, subscriber)
+            else:
+                rejected.append((pattern, subscriber, errors[pattern]))
+
+        return rejected
+
+    def remove(self, pattern: str, subscriber: Hashable) -> bool:
+        """
+        Unsubscribe from a filter, pruning the levels left empty
+
+        :param pattern: MQTT topic filter
+        :param subscriber: identifier of the subscriber
+
+        :returns: `bool` of whether the subscription existed
+        """
+
+        segments = pattern.split('/')
+        multi_level = segments[-1] == MULTI_LEVEL_WILDCARD
+        if multi_level:
+            segments.pop()
+
+        path = []
+        node = self.root
+        for segment in segments:
+            if segment == SINGLE_LEVEL_WILDCARD:
+                child = node.any
+            else:
+                child = node.children.get(segment)
+            if child is None:
+                return False
+            path.append((node, segment))
+            node = child
+
+        subscribers = node.rest if multi_level else node.subscribers
+        if subscriber not in subscribers:
+            return False
+        subscribers.discard(subscriber)
+        self.subscriptions -= 1
+
+        for parent, segment in reversed(path):
+            if node:
+                break
+            if segment == SINGLE_LEVEL_WILDCARD:
+                parent.any = None
+            else:
+                del parent.children[segment]
+            node = parent
+
+        return True
+
+    def remove_batch(self,
+                     subscriptions: Iterable[tuple[str, Hashable]]) -> int:
+        """
+        Remove many subscriptions
+
+        :param subscriptions: iterable of (filter, subscriber) `tuple`s
+
+        :returns: `int` of subscriptions removed
+        """
+
+        return sum(self.remove(pattern, subscriber)
+                   for pattern, subscriber in subscriptions)
+
+    def match(self, topic: str) -> set:
+        """
+        Find the subscribers of the filters matching a topic
+
+        :param topic: published topic
+                      (e.g. `origin/a/wis2/ca-eccc-msc/data/core/weather`)
+
+        :returns: `set` of subscribers
+        """
+
+        result = set()
+        nodes = [self.root]
+
+        for segment in topic.split('/'):
+            reached = []
+            for node in nodes:
+                if node.rest:
+                    result |= node.rest
+                child = node.children.get(segment)
+                if child is not None:
+                    reached.append(child)
+                if node.any is not None:
+                    reached.append(node.any)
+            if not reached:
+                return result
+            nodes = reached
+
+        for node in nodes:
+            result |= node.subscribers
+            # `a/#` also matches `a`
+            result |= node.rest
+
+        return result
+
+    def match_batch(self, topics: Iterable[str]) -> list[set]:
+        """
+        Match many topics
+
+        Results are memoized for the duration of the batch, as the same
+        topics tend to repeat heavily in broker traffic; the returned sets
+        are shared between repeated topics.
+
+        :param topics: iterable of topics
+
+        :returns: `list` of `set`s of subscribers, in input order
+        """
+
+        cache = {}
+        cache_get = cache.get
+        match = self.match
+        results = []
+        append = results.append
+
+        for topic in topics:
+            result = cache_get(topic)
+            if result is None:
+                result = cache[topic] = match(topic)
+            append(result)
+
+        return results
+
+
+def read_subscriptions(fh) -> list[tuple[str, str]]:
+    """
+    Read subscriptions, one per line: a filter, optionally followed by a tab
+    and the identifier of the subscriber (the filter itself otherwise)
+
+    :param fh: file object
+
+    :returns: `list` of (filter, subscriber) `tuple`s
+    """
+
+    subscriptions = []
+    for line in fh:
+        line = line.rstrip('\n')
+        if not line:
+            continue
+        pattern, _, subscriber = line.partition('\t')
+        subscriptions.append((pattern, subscriber or pattern))
+
+    return subscriptions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Match WIS2 topics (one per line, from stdin) to '
+                    'subscriptions')
+    parser.add_argument('subscriptions',
+                        help='File of subscriptions: a filter per line, optionally followed by a tab and a subscriber')  # noqa
+    parser.add_argument('-r', '--root', default='.', type=Path,
+                        help='Root of the wis2-topic-hierarchy repository')
+    parser.add_argument('--no-check', action='store_true',
+                        help='Accept filters which do not match any topic of the hierarchy')  # noqa
+    parser.add_argument('-c', '--count', action='store_true',
+                        help='Print the number of matching subscribers')
+
+    args = parser.parse_args()
+
+    router = SubscriptionRouter(
+        None if args.no_check else topic_trie.load(args.root))
+
+    with open(args.subscriptions, encoding='utf-8') as fh:
+        rejected = router.add_batch(read_subscriptions(fh))
+    for pattern, subscriber, reason in rejected:
+        print(f'Rejected {subscriber}: {reason}', file=sys.stderr)
+
+    write = sys.stdout.write
+    for batch in read_topics(sys.stdin):
+        output = []
+        for topic, subscribers in zip(batch, router.match_batch(batch)):
+            if args.count:
+                output.append(f'{topic}\t{len(subscribers)}\n')
+            else:
+                output.append(
+                    f'{topic}\t{",".join(sorted(map(str, subscribers)))}\n')
+        write(''.join(output))
+
+    sys.exit(1 if rejected else 0)
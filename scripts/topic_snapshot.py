@@ -0,0 +1,456 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+import sys
+from typing import Iterator, NamedTuple
+
+import hierarchy
+
+MAGIC = b'WTHSNAP\0'
+VERSION = 1
+SNAPSHOT_FILE = 'topic-hierarchy/topic-hierarchy.snapshot'
+
+# magic, version, node count, string count, offsets of the node table, of
+# the string offsets and of the string data, SHA-256 digest of the sources
+HEADER = struct.Struct('<8sIIIIII32s')
+# name, description, source and status (string ids), parent, first child,
+# number of children, position among the siblings in definition order
+# (node ids and counts), flags
+NODE = struct.Struct('<8IB3x')
+# first child and number of children of a node record
+CHILDREN = struct.Struct('<II')
+CHILDREN_OFFSET = 20
+STRING_OFFSET = struct.Struct('<I')
+STRING_RANGE = struct.Struct('<II')
+
+NO_PARENT = 0xffffffff
+REGISTER = 0x01
+EXPERIMENTAL = 0x02
+
+# results of a topic lookup: (valid, leaf), as by `TopicTrie.validate`
+INVALID = (False, False)
+VALID = (True, False)
+VALID_LEAF = (True, True)
+
+
+class SnapshotNode(NamedTuple):
+    """Node of a snapshot, with its strings decoded"""
+
+    index: int
+    name: str
+    description: str
+    source: str
+    status: str
+    parent: int
+    first_child: int
+    child_count: int
+    order: int
+    register: bool
+
+
+def sources_digest(sources: dict) -> bytes:
+    """
+    Compute the digest of the CSV files a hierarchy was read from
+
+    :param sources: `dict` of SHA-256 digests by path
+
+    :returns: `bytes` of the SHA-256 digest
+    """
+
+    document = json.dumps(sorted(sources.items())).encode('utf-8')
+
+    return hashlib.sha256(document).digest()
+
+
+def write_snapshot(model: hierarchy.Hierarchy, snapshot_path: Path) -> None:
+    """
+    Write the binary snapshot of a hierarchy
+
+    Nodes are laid out breadth first, so that the children of a node are
+    contiguous and sorted by (UTF-8) name, to be looked up by binary
+    search.  Every distinct string is stored once.  The snapshot is written
+    to a temporary file and then renamed, so that processes which mapped
+    the previous version keep it intact.
+
+    :param model: `Hierarchy` to write
+    :param snapshot_path: path of the snapshot
+
+    :returns: `None`
+    """
+
+    strings = {'': 0}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    nodes = [model.root]
+    parents = [NO_PARENT]
+    orders = [0]
+    records = []
+
+    # nodes grows while it is iterated, one generation after the other
+    for i, node in enumerate(nodes):
+        children = sorted(enumerate(node.children.values()),
+                          key=lambda child: child[1].name.encode('utf-8'))
+        first_child = len(nodes)
+        for order, child in children:
+            nodes.append(child)
+            parents.append(i)
+            orders.append(order)
+
+        flags = REGISTER if node.register else 0
+        if node.name == 'experimental':
+            flags |= EXPERIMENTAL
+        records.append(NODE.pack(
+            intern(node.name), intern(node.description), intern(node.source),
+            intern(node.status), parents[i], first_child, len(children),
+            orders[i], flags))
+
+    data = [value.encode('utf-8') for value in strings]
+    offsets = [0]
+    for value in data:
+        offsets.append(offsets[-1] + len(value))
+
+    nodes_offset = HEADER.size
+    strings_offset = nodes_offset + NODE.size * len(records)
+    blob_offset = strings_offset + STRING_OFFSET.size * len(offsets)
+
+    partial_path = snapshot_path.with_name(f'.{snapshot_path.name}.part')
+    with partial_path.open('wb') as fh:
+        fh.write(HEADER.pack(MAGIC, VERSION, len(records), len(strings),
+                             nodes_offset, strings_offset, blob_offset,
+                             sources_digest(model.sources)))
+        fh.write(b''.join(records))
+        fh.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        fh.write(b''.join(data))
+    os.replace(partial_path, snapshot_path)
+
+
+class Snapshot:
+    """
+    Read-only view of a binary snapshot of the hierarchy
+
+    Nodes and strings are read from the underlying buffer (usually a
+    shared, read-only memory map of the file) when accessed: opening a
+    snapshot does not parse it, and the processes mapping the same file
+    share one copy of it in the page cache.  Only the strings accessed
+    are copied out of the buffer, to be decoded or compared: Python has
+    no ordering of `memoryview`s, so each comparison of a name lookup
+    copies that name (a few bytes).
+    """
+
+    def __init__(self, buffer) -> None:
+        """
+        Initialize a view of a snapshot
+
+        :param buffer: bytes-like object with the snapshot
+
+        :returns: `None`
+        """
+
+        if len(buffer) < HEADER.size:
+            raise ValueError('Truncated snapshot')
+
+        (magic, version, self.node_count, self.string_count,
+         self.nodes_offset, self.strings_offset, self.blob_offset,
+         self.digest) = HEADER.unpack_from(buffer)
+
+        if magic != MAGIC:
+            raise ValueError('Not a topic hierarchy snapshot')
+        if version != VERSION:
+            raise ValueError(f'Unsupported snapshot version {version}')
+
+        self.buffer = buffer
+        self._file = None
+        self.tree = self.find(hierarchy.TREE_LEVEL)
+        # relational levels (channel to data-policy), in order
+        self.levels = sorted((i for i in self.children(0) if i != self.tree),
+                             key=self.order)
+
+    @classmethod
+    def open(cls, snapshot_path: Path) -> 'Snapshot':
+        """
+        Map a snapshot file in memory
+
+        :param snapshot_path: path of the snapshot
+
+        :returns: `Snapshot` of the file, to be closed once done
+        """
+
+        fh = snapshot_path.open('rb')
+        try:
+            buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            fh.close()
+            raise ValueError(f'Empty snapshot {snapshot_path}')
+        snapshot = cls(buffer)
+        snapshot._file = fh
+
+        return snapshot
+
+    def close(self) -> None:
+        """
+        Unmap the snapshot file, if any
+
+        :returns: `None`
+        """
+
+        if self._file is not None:
+            self.buffer.close()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _record(self, index: int) -> tuple:
+        return NODE.unpack_from(self.buffer,
+                                self.nodes_offset + NODE.size * index)
+
+    def _string_bytes(self, string_id: int) -> bytes:
+        start, end = STRING_RANGE.unpack_from(
+            self.buffer, self.strings_offset + STRING_OFFSET.size * string_id)
+        return self.buffer[self.blob_offset + start:self.blob_offset + end]
+
+    def string(self, string_id: int) -> str:
+        """
+        Get a string of the string table
+
+        :param string_id: id of the string
+
+        :returns: `str` of the string
+        """
+
+        return self._string_bytes(string_id).decode('utf-8')
+
+    def node(self, index: int) -> SnapshotNode:
+        """
+        Get a node
+
+        :param index: index of the node (0 for the root)
+
+        :returns: `SnapshotNode` of the node
+        """
+
+        (name, description, source, status, parent, first_child,
+         child_count, order, flags) = self._record(index)
+
+        return SnapshotNode(index, self.string(name),
+                            self.string(description), self.string(source),
+                            self.string(status), parent, first_child,
+                            child_count, order, bool(flags & REGISTER))
+
+    def name(self, index: int) -> str:
+        """
+        Get the name of a node
+
+        :param index: index of the node
+
+        :returns: `str` of the name
+        """
+
+        return self.string(self._record(index)[0])
+
+    def order(self, index: int) -> int:
+        """
+        Get the position of a node among its siblings, in definition order
+
+        :param index: index of the node
+
+        :returns: `int` of the position
+        """
+
+        return self._record(index)[7]
+
+    def children(self, index: int) -> range:
+        """
+        Get the children of a node, sorted by name
+
+        :param index: index of the node
+
+        :returns: `range` of the indexes of the children
+        """
+
+        record = self._record(index)
+
+        return range(record[5], record[5] + record[6])
+
+    def child(self, index: int, name: str) -> int:
+        """
+        Find a child of a node by name
+
+        The children are searched by bisection on their UTF-8 names, each
+        name compared being copied out of the buffer.
+
+        :param index: index of the node
+        :param name: name of the child
+
+        :returns: `int` of the index of the child, or `None`
+        """
+
+        buffer = self.buffer
+        nodes_offset = self.nodes_offset
+        low, count = CHILDREN.unpack_from(
+            buffer, nodes_offset + NODE.size * index + CHILDREN_OFFSET)
+        key = name.encode('utf-8')
+        high = low + count
+
+        while low < high:
+            middle = (low + high) // 2
+            string_id, = STRING_OFFSET.unpack_from(
+                buffer, nodes_offset + NODE.size * middle)
+            start, end = STRING_RANGE.unpack_from(
+                buffer, self.strings_offset + STRING_OFFSET.size * string_id)
+            value = buffer[self.blob_offset + start:self.blob_offset + end]
+            if value < key:
+                low = middle + 1
+            elif value > key:
+                high = middle
+            else:
+                return middle
+
+        return None
+
+    def find(self, path: str, index: int = 0) -> int:
+        """
+        Find a node by path
+
+        :param path: path relative to the node (e.g.
+                     `earth-system-discipline/weather/aviation`)
+        :param index: index of the node the path is relative to
+
+        :returns: `int` of the index of the node, or `None`
+        """
+
+        for name in path.split('/'):
+            index = self.child(index, name)
+            if index is None:
+                return None
+
+        return index
+
+    def walk(self, index: int = 0,
+             prefix: str = '') -> Iterator[tuple[str, int]]:
+        """
+        Generate all descendants of a node, depth first, sorted by name
+
+        :param index: index of the node
+        :param prefix: path prefix of the children (with trailing `/`)
+
+        :returns: iterator of (path, index) `tuple`s
+        """
+
+        for child in self.children(index):
+            path = f'{prefix}{self.name(child)}'
+            yield path, child
+            yield from self.walk(child, f'{path}/')
+
+    def validate(self, topic: str) -> tuple[bool, bool]:
+        """
+        Validate a full topic against the hierarchy, as
+        `TopicTrie.validate`
+
+        :param topic: topic (e.g. `origin/a/wis2/ca-eccc-msc/data/core`)
+
+        :returns: `tuple` of (valid, leaf)
+        """
+
+        depth = len(self.levels)
+        parts = topic.split('/')
+
+        for value, level in zip(parts, self.levels):
+            if self.child(level, value) is None:
+                return INVALID
+
+        if len(parts) <= depth:
+            return VALID
+
+        index = self.tree
+        experimental = False
+        for i in range(depth, len(parts)):
+            child = self.child(index, parts[i])
+            if child is None:
+                # any levels are allowed below an experimental topic
+                if experimental and '' not in parts[i:]:
+                    return VALID_LEAF
+                return INVALID
+            index = child
+            experimental = experimental or \
+                bool(self._record(index)[8] & EXPERIMENTAL)
+
+        return VALID_LEAF if not self._record(index)[6] else VALID
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build and query the binary snapshot of the hierarchy')
+    parser.add_argument('-s', '--snapshot', default=SNAPSHOT_FILE, type=Path,
+                        help='Snapshot file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser(
+        'build', help='Build the snapshot from the CSV files')
+    build_parser.add_argument('-r', '--root', default='.', type=Path,
+                              help='Root of the wis2-topic-hierarchy repository')  # noqa
+    subparsers.add_parser('info', help='Print the header of the snapshot')
+    validate_parser = subparsers.add_parser(
+        'validate', help='Validate WIS2 topics (one per line) from stdin')
+    validate_parser.add_argument('-i', '--invalid-only', action='store_true',
+                                 help='Only print invalid topics')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        write_snapshot(hierarchy.load(args.root), args.snapshot)
+        print(f'Wrote {args.snapshot}')
+        sys.exit(0)
+
+    with Snapshot.open(args.snapshot) as snapshot:
+        if args.command == 'info':
+            print(f'version: {VERSION}')
+            print(f'nodes: {snapshot.node_count}')
+            print(f'strings: {snapshot.string_count}')
+            print(f'size: {len(snapshot.buffer)}')
+            print(f'sources digest: {snapshot.digest.hex()}')
+            sys.exit(0)
+
+        invalid = 0
+        for line in sys.stdin:
+            topic = line.rstrip('\n')
+            valid, leaf = snapshot.validate(topic)
+            if not valid:
+                invalid += 1
+                print(f'{topic}\tinvalid')
+            elif not args.invalid_only:
+                print(f'{topic}\t{"leaf" if leaf else "valid"}')
+
+    sys.exit(1 if invalid else 0)
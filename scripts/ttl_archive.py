@@ -0,0 +1,193 @@
+###############################################################################
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+###############################################################################
+
+
+import io
+import os
+from pathlib import Path, PurePosixPath
+import tarfile
+import time
+import zipfile
+
+TAR_MODES = {
+    '.tar': 'w|',
+    '.tgz': 'w|gz',
+    '.gz': 'w|gz',
+    '.bz2': 'w|bz2',
+    '.xz': 'w|xz'
+}
+
+
+def is_archive(path: Path) -> bool:
+    """
+    Check whether a path names a supported archive (zip, tar, tar.gz, etc.)
+
+    :param path: `pathlib.Path` of the file
+
+    :returns: `True` if the path has an archive suffix
+    """
+
+    return path.suffix in TAR_MODES or path.suffix == '.zip'
+
+
+class ArchiveWriter:
+    """
+    Streaming writer of TTL files into a zip or tar archive
+
+    The archive is written to a temporary file next to it, and only
+    replaces an existing archive once complete, so that readers never see
+    a partial archive.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        Initialize the writer
+
+        :param path: `pathlib.Path` of the archive; the format is given by
+                     the suffix (`.zip`, `.tar`, `.tar.gz`, `.tgz`, etc.)
+
+        :returns: `None`
+        """
+
+        if not is_archive(path):
+            raise ValueError(f'Unsupported archive format {path.name}')
+
+        self.path = path
+        self.partial_path = path.with_name(f'.{path.name}.part')
+        self.mtime = time.time()
+        self.files = 0
+        self._zip = None
+        self._tar = None
+
+    def __enter__(self) -> 'ArchiveWriter':
+        if self.path.suffix == '.zip':
+            self._zip = zipfile.ZipFile(self.partial_path, 'w',
+                                        zipfile.ZIP_DEFLATED)
+        else:
+            self._tar = tarfile.open(str(self.partial_path),
+                                     TAR_MODES[self.path.suffix])
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
+
+        if exc_type is None:
+            os.replace(self.partial_path, self.path)
+        else:
+            self.partial_path.unlink(missing_ok=True)
+
+    def add(self, name: str, text: str) -> int:
+        """
+        Add a file to the archive
+
+        :param name: path of the file in the archive
+        :param text: content of the file
+
+        :returns: `int` of bytes written
+        """
+
+        data = text.encode('utf-8')
+        if self._zip is not None:
+            self._zip.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = self.mtime
+            info.mode = 0o644
+            self._tar.addfile(info, io.BytesIO(data))
+
+        self.files += 1
+        return len(data)
+
+
+class DirectorySource:
+    """TTL files of a directory tree"""
+
+    def files(self, directory: Path) -> list[Path]:
+        """
+        List the TTL files below a directory
+
+        :param directory: `pathlib.Path` of the directory
+
+        :returns: sorted `list` of TTL file paths
+        """
+
+        return sorted(Path(directory).rglob('*.ttl'))
+
+    def read(self, filepath: Path) -> str:
+        """
+        Read a TTL file
+
+        :param filepath: path of the TTL file
+
+        :returns: `str` of the TTL
+        """
+
+        return Path(filepath).read_text(encoding='utf-8')
+
+
+class ArchiveSource(DirectorySource):
+    """
+    TTL files of a zip or tar archive, as written by `ArchiveWriter`
+
+    Zip members are read on demand; tar archives can only be read
+    sequentially and are read into memory at once.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        Open an archive
+
+        :param path: `pathlib.Path` of the archive
+
+        :returns: `None`
+        """
+
+        self.contents = None
+        if zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            names = self._zip.namelist()
+        else:
+            self._zip = None
+            self.contents = {}
+            with tarfile.open(path, 'r:*') as tar:
+                for info in tar:
+                    if info.isfile():
+                        data = tar.extractfile(info).read()
+                        self.contents[info.name] = data.decode('utf-8')
+            names = list(self.contents)
+
+        self.names = {PurePosixPath(name) for name in names
+                      if name.endswith('.ttl')}
+
+    def files(self, directory: Path) -> list[PurePosixPath]:
+        directory = PurePosixPath(Path(directory).as_posix())
+        return sorted(name for name in self.names
+                      if directory in name.parents)
+
+    def read(self, filepath: PurePosixPath) -> str:
+        name = PurePosixPath(filepath).as_posix()
+        if self._zip is not None:
+            return self._zip.read(name).decode('utf-8')
+        return self.contents[name]
@@ -20,12 +20,20 @@
 ###############################################################################
 
 import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import json
 from pathlib import Path
+import sys
+import threading
+from typing import TextIO
 import requests
-import rdflib
-import rdflib.compare
 from enum import Enum
 
+import canonical_ttl
+import http_transport
+import instrumentation
+from ttl_archive import ArchiveSource, DirectorySource
+
 
 HEADERS = {
     'Content-type': 'text/turtle; charset=UTF-8'
@@ -35,6 +43,71 @@ PROD_REGISTRY = 'https://codes.wmo.int'
 TEST_REGISTRY = 'https://ci.codes.wmo.int'
 PUBLIC_ID_PREFIX = 'http://codes.wmo.int'
 
+CHECK_HEADERS = {
+    'Accept': 'text/turtle',
+    'Cache-Control': 'private, no-store, no-cache, max-age=0'
+}
+
+LDP_NEXT_PAGE = '<http://www.w3.org/ns/ldp#nextPage>'
+
+
+# messages of the entry being processed by the current thread, if any
+_messages = threading.local()
+
+
+def log(message: str = '', end: str = '\n', file: TextIO = None) -> None:
+    """
+    Print a message, or collect it if the current thread is processing an
+    entry (see `collect_messages`), so that the messages of entries
+    processed concurrently do not interleave
+
+    :param message: message to print
+    :param end: string appended to the message
+    :param file: stream to print to (default: stdout)
+
+    :returns: `None`
+    """
+
+    buffer = getattr(_messages, 'buffer', None)
+    if buffer is None:
+        print(message, end=end, file=file)
+    else:
+        buffer.append((file, f'{message}{end}'))
+
+
+def collect_messages(function, *args) -> tuple:
+    """
+    Call a function, collecting the messages it logs
+
+    :param function: function to call
+    :param args: arguments of the function
+
+    :returns: `tuple` of the result of the function and of the `list` of
+              (stream, text) messages, to be passed to `print_messages`
+    """
+
+    buffer = _messages.buffer = []
+    try:
+        return function(*args), buffer
+    except Exception:
+        print_messages(buffer)
+        raise
+    finally:
+        _messages.buffer = None
+
+
+def print_messages(messages: list[tuple[TextIO, str]]) -> None:
+    """
+    Print collected messages, in order
+
+    :param messages: `list` of (stream, text) messages
+
+    :returns: `None`
+    """
+
+    for file, text in messages:
+        (file or sys.stdout).write(text)
+
 
 # class syntax
 class CheckResult(Enum):
@@ -43,14 +116,16 @@ class CheckResult(Enum):
     NEW = 3
 
 
-def authenticate(base_url: str, user_id: str,
-                 password: str) -> requests.Session:
+def authenticate(base_url: str, user_id: str, password: str,
+                 session: requests.Session = None) -> requests.Session:
     """
     Constructs authenticated session (with JSESSIONID cookie)
 
     :param base_url: base URL of registry API
     :param user_id: GitHub User ID
     :param password: password
+    :param session: optional session to authenticate (e.g. a
+                    `http_transport.RegistrySession`)
 
     :returns: Session for further interaction upon successful login
     """
@@ -58,14 +133,14 @@ def authenticate(base_url: str, user_id: str,
     url = f'{base_url}/system/security/apilogin'
     print(f'Authenticating at {url}')
 
-    session = requests.Session()
+    session = session or requests.Session()
 
     data = {
         'userid': f'https://api.github.com/users/{user_id}',
         'password': password
     }
 
-    auth = session.post(url, data=data)
+    auth = instrumentation.request(session, 'POST', url, data=data)
 
     if auth.status_code != 200:
         raise ValueError('Authentication failed')
@@ -74,7 +149,8 @@ def authenticate(base_url: str, user_id: str,
 
 
 def post(session: requests.Session, url: str, payload: str,
-         dry_run: bool, verbose: bool, status: str) -> None:
+         dry_run: bool, verbose: bool, status: str,
+         batch: bool = False) -> bool:
     """
     Posts new content to the intended parent register
 
@@ -84,38 +160,44 @@ def post(session: requests.Session, url: str, payload: str,
     :param dry_run: whether to run as a dry run (simulates request only)
     :param verbose: whether to provide verbose output
     :param status: publication status (experimental, stable)
+    :param batch: whether the payload is a new register with its members
+                  (`skos:member`), registered at once
 
-    :returns: `None`
+    :returns: `bool` of whether the request succeeded (`True` on dry run)
     """
 
     params = {
         'status': status
     }
+    if batch:
+        params['batch-managed'] = ''
 
     if not dry_run:
         if verbose:
-            print(f'  Posting to: {url}')
-            print(f'    headers: {HEADERS}')
-            print(f'    params: {params}')
+            log(f'  Posting to: {url}')
+            log(f'    headers: {HEADERS}')
+            log(f'    params: {params}')
 
-        res = session.post(url, headers=HEADERS, data=payload.encode('utf-8'),
-                           params=params, stream=False)
+        res = instrumentation.request(
+            session, 'POST', url, headers=HEADERS,
+            data=payload.encode('utf-8'), params=params, stream=False)
 
         if res.status_code != 201:
-            print(f'  POST failed with {res.status_code} {res.reason}: {res.content.decode("utf-8")}')  # noqa
+            log(f'  POST failed with {res.status_code} {res.reason}: {res.content.decode("utf-8")}')  # noqa
+            return False
         elif verbose:
-            print(f'  POST succeeded with {res.status_code} {res.reason}')
+            log(f'  POST succeeded with {res.status_code} {res.reason}')
     else:
-        print(f'  HTTP POST (dry run) to: {url}')
+        log(f'  HTTP POST (dry run) to: {url}')
         if verbose:
-            print(f'    headers: {HEADERS}')
-            print(f'    params: {params}')
+            log(f'    headers: {HEADERS}')
+            log(f'    params: {params}')
 
-    return
+    return True
 
 
 def put(session: requests.Session, url: str, payload: str,
-        dry_run: bool, verbose: bool, status: str) -> None:
+        dry_run: bool, verbose: bool, status: str) -> bool:
     """
     Updates definition of a register or entity.
 
@@ -126,7 +208,7 @@ def put(session: requests.Session, url: str, payload: str,
     :param verbose: whether to provide verbose output
     :param status: publication status (experimental, stable)
 
-    :returns: `None`
+    :returns: `bool` of whether the request succeeded (`True` on dry run)
     """
 
     params = {
@@ -136,30 +218,34 @@ def put(session: requests.Session, url: str, payload: str,
 
     if not dry_run:
         if verbose:
-            print(f'  HTTP PUT to: {url}')
-            print(f'    headers: {HEADERS}')
-            print(f'    params: {params}')
+            log(f'  HTTP PUT to: {url}')
+            log(f'    headers: {HEADERS}')
+            log(f'    params: {params}')
 
-        res = session.put(url, headers=HEADERS, data=payload.encode('utf-8'),
-                          params=params)
+        res = instrumentation.request(
+            session, 'PUT', url, headers=HEADERS,
+            data=payload.encode('utf-8'), params=params)
 
         if res.status_code != 204:
-            print(f'  PUT failed with {res.status_code} {res.reason}: {res.content.decode("utf-8")}')  # noqa
+            log(f'  PUT failed with {res.status_code} {res.reason}: {res.content.decode("utf-8")}')  # noqa
+            return False
         elif verbose:
-            print(f'  PUT succeeded with {res.status_code} {res.reason}')
+            log(f'  PUT succeeded with {res.status_code} {res.reason}')
     else:
-        print(f'  HTTP PUT (dry run) to {url}')
+        log(f'  HTTP PUT (dry run) to {url}')
         if verbose:
-            print(f'    headers: {HEADERS}')
-            print(f'    params: {params}')
+            log(f'    headers: {HEADERS}')
+            log(f'    params: {params}')
 
-    return
+    return True
 
 
+@instrumentation.profiled
 def check_file(session: requests.Session, url: str, public_id: str,
                local_ttl: str, verbose: bool) -> CheckResult:
     """
-    Compares local file with the server version (if any) as graphs.
+    Compares local file with the server version (if any) as sets of
+    canonical triples.
 
     :param session: API session
     :param url: URL of the server resource to compare with.
@@ -171,38 +257,33 @@ def check_file(session: requests.Session, url: str, public_id: str,
     """
 
     url_to_check = url + '/'
-    headers_to_check = {
-        'Accept': 'text/turtle',
-        'Cache-Control': 'private, no-store, no-cache, max-age=0'
-    }
     if verbose:
-        print(f'  Checking {url_to_check} - ', end=' ')
+        log(f'  Checking {url_to_check} - ', end=' ')
 
-    response = session.get(url_to_check, headers=headers_to_check)
+    response = instrumentation.request(session, 'GET', url_to_check,
+                                       headers=CHECK_HEADERS)
 
     if response.status_code == 200:
         if verbose:
-            print('Existing entry, going to compare:', end=' ')
-        server_rdf = rdflib.Graph()
-        server_rdf.parse(data=response.text, format='n3')
-
-        local_rdf = rdflib.Graph()
-        local_rdf.parse(data=local_ttl, format='n3', publicID=public_id)
-        in_both, in_local, in_server = rdflib.compare.graph_diff(local_rdf,
-                                                                 server_rdf)
+            log('Existing entry, going to compare:', end=' ')
+        server_triples = canonical_ttl.parse(response.text)
+        local_triples = canonical_ttl.parse(local_ttl, public_id)
+        with instrumentation.phase('diff'):
+            in_local = local_triples - server_triples
+
         if len(in_local) == 0:
             if verbose:
-                print('Equal.')
+                log('Equal.')
             return CheckResult.EQUAL
         else:
             if verbose:
-                print('Changed.')
+                log('Changed.')
                 for s, p, o in in_local:
-                    print(f'    {p}: {o}')
+                    log(f'    {p}: {o}')
             return CheckResult.CHANGED
     elif response.status_code == 404:
         if verbose:
-            print('New.')
+            log('New.')
         return CheckResult.NEW
     else:
         raise ValueError(
@@ -210,8 +291,249 @@ def check_file(session: requests.Session, url: str, public_id: str,
         )
 
 
+class RegistrySnapshot:
+    """
+    Contents of registers, fetched with one (paged) request per register
+    and indexed by subject, to compare entries without one request each
+    """
+
+    def __init__(self, session: requests.Session,
+                 verbose: bool = False) -> None:
+        """
+        Initialize an empty snapshot
+
+        :param session: API session
+        :param verbose: whether to provide verbose output
+
+        :returns: `None`
+        """
+
+        self.session = session
+        self.verbose = verbose
+        self.registers = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, register_url: str) -> dict:
+        """
+        Get the contents of a register, fetching them on first access
+
+        Registers are fetched lazily, so that a register created during the
+        upload is only fetched once it exists.
+
+        :param register_url: URL of the register
+
+        :returns: `dict` of `set`s of (predicate, object) by subject
+        """
+
+        with self._lock:
+            lock = self._locks.setdefault(register_url, threading.Lock())
+
+        with lock:
+            if register_url not in self.registers:
+                self.registers[register_url] = self._fetch(register_url)
+
+        return self.registers[register_url]
+
+    def _fetch(self, register_url: str) -> dict:
+        index = {}
+        page_url = f'{register_url}?_view=with_metadata&firstPage'
+
+        while page_url is not None:
+            if self.verbose:
+                log(f'  Fetching register contents {page_url}')
+
+            response = instrumentation.request(
+                self.session, 'GET', page_url, headers=CHECK_HEADERS)
+            if response.status_code == 404:
+                break
+            elif response.status_code != 200:
+                raise ValueError(
+                    f'Cannot fetch {page_url}: {response.status_code} {response.reason}: {response.content.decode("utf-8")}'  # noqa
+                )
+
+            page_url = None
+            for s, p, o in canonical_ttl.parse(response.text):
+                index.setdefault(s, set()).add((p, o))
+                if p == LDP_NEXT_PAGE:
+                    page_url = o[1:-1]
+
+        return index
+
+
+@instrumentation.profiled
+def check_snapshot(snapshot: RegistrySnapshot, url: str, public_id: str,
+                   local_ttl: str, verbose: bool) -> CheckResult:
+    """
+    Compares local file with the server version (if any) as found in the
+    snapshot of its parent register.
+
+    :param snapshot: snapshot of the registers
+    :param url: URL of the server resource to compare with.
+    :param public_id: Id of the resource.
+    :param local_ttl: Current local TTL representation.
+    :param verbose: Whether to provide verbose output
+
+    :returns: `CheckResult` of the comparison
+    """
+
+    register_url = '/'.join(url.split('/')[:-1])
+    index = snapshot.get(register_url)
+
+    if verbose:
+        log(f'  Checking {url} in {register_url} - ', end=' ')
+
+    if f'<{public_id}>' not in index:
+        if verbose:
+            log('New.')
+        return CheckResult.NEW
+
+    local_triples = canonical_ttl.parse(local_ttl, public_id)
+    with instrumentation.phase('diff'):
+        in_local = [(s, p, o) for s, p, o in local_triples
+                    if (p, o) not in index.get(s, ())]
+
+    if len(in_local) == 0:
+        if verbose:
+            log('Equal.')
+        return CheckResult.EQUAL
+    else:
+        if verbose:
+            log('Changed.')
+            for s, p, o in in_local:
+                log(f'    {p}: {o}')
+        return CheckResult.CHANGED
+
+
+def canonical_digest(ttl: str, public_id: str) -> str:
+    """
+    Computes a digest of the triples of a TTL document, independent of
+    their serialization
+
+    :param ttl: TTL representation
+    :param public_id: Id of the resource.
+
+    :returns: `str` of the hexadecimal SHA-256 digest
+    """
+
+    return canonical_ttl.digest(canonical_ttl.parse(ttl, public_id))
+
+
+def build_batch_payload(ttl: str, public_id: str,
+                        members: list[tuple[str, str]]) -> str:
+    """
+    Builds the payload registering a new register with its members in a
+    single request: the triples of the register and of every member, with
+    the `skos:member` links identifying the members
+
+    :param ttl: TTL representation of the register
+    :param public_id: Id of the register.
+    :param members: `list` of (TTL representation, Id) of the members
+
+    :returns: `str` of the Turtle payload
+    """
+
+    triples = canonical_ttl.parse(ttl, public_id)
+    for member_ttl, member_id in members:
+        triples |= canonical_ttl.parse(member_ttl, member_id)
+        triples.add((f'<{public_id}>', canonical_ttl.SKOS_MEMBER,
+                     f'<{member_id}>'))
+
+    return (canonical_ttl.format_prefixes(canonical_ttl.PREFIXES) +
+            canonical_ttl.format_turtle(triples, canonical_ttl.PREFIXES))
+
+
+class UploadManifest:
+    """
+    Persistent record of the digests of the entries last confirmed on
+    each registry, to skip unchanged entries entirely
+    """
+
+    def __init__(self, path: Path, registry: str,
+                 verify: bool = False) -> None:
+        """
+        Load the manifest
+
+        :param path: `pathlib.Path` of the manifest file
+        :param registry: base URL of the registry the entries are checked
+                         against
+        :param verify: whether to compare all entries with the registry
+                       regardless of the manifest
+
+        :returns: `None`
+        """
+
+        self.path = path
+        self.registry = registry
+        self.verify = verify
+        self.manifest = {}
+        self._lock = threading.Lock()
+
+        if path.exists():
+            with path.open(encoding='utf-8') as fh:
+                self.manifest = json.load(fh)
+
+        self.entries = self.manifest.setdefault(registry, {})
+
+    def is_current(self, entry_id: str, digest: str) -> bool:
+        """
+        Check whether an entry was confirmed on the registry as is
+
+        :param entry_id: id of the entry
+        :param digest: canonical digest of the local entry
+
+        :returns: `True` if the entry does not need to be checked
+        """
+
+        return not self.verify and self.entries.get(entry_id) == digest
+
+    def record(self, entry_id: str, digest: str) -> None:
+        """
+        Record an entry as confirmed on the registry
+
+        :param entry_id: id of the entry
+        :param digest: canonical digest of the entry
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            self.entries[entry_id] = digest
+
+    def save(self) -> None:
+        """
+        Write the manifest
+
+        :returns: `None`
+        """
+
+        with self._lock:
+            self.manifest[self.registry] = dict(sorted(self.entries.items()))
+            with self.path.open('w', encoding='utf-8') as fh:
+                json.dump(self.manifest, fh, indent=1)
+
+
+def entry_id(filepath: Path) -> str:
+    """
+    Gets the id of the entry of a TTL file, relative to the registry root
+
+    :param filepath: `pathlib.Path` of the TTL file (e.g. `wis/a/b.ttl`)
+
+    :returns: `str` of the entry id (e.g. `wis/a/b`)
+    """
+
+    if filepath.stem == 'wis':
+        return filepath.stem
+    return str(filepath.parent / filepath.stem)
+
+
 def process_file(session: requests.Session, url: str, filepath: Path,
-                 dry_run: bool, verbose: bool, status: str) -> None:
+                 dry_run: bool, verbose: bool, status: str,
+                 snapshot: RegistrySnapshot = None,
+                 manifest: UploadManifest = None,
+                 members: list[Path] = None,
+                 batched: set = None,
+                 source: DirectorySource = None) -> bool:
     """
     Uploads given TTL file to the registry
 
@@ -221,32 +543,214 @@ def process_file(session: requests.Session, url: str, filepath: Path,
     :param dry_run: whether to run as a dry run (simulates request only)
     :param verbose: whether to provide verbose output
     :param status: publication status (experimental, stable)
-
-    :returns: `None`
+    :param snapshot: optional snapshot of the registers to compare with,
+                     instead of fetching the entry
+    :param manifest: optional manifest of the entries confirmed on the
+                     registry, to skip unchanged entries
+    :param members: optional TTL files of the entries of the register, to
+                    register along with it in one request if it is new
+    :param batched: `set` collecting the members registered that way
+    :param source: optional source of the TTL files (directory or archive)
+
+    :returns: `bool` of whether the entry exists on the registry afterwards
     """
 
-    with filepath.open(encoding='utf-8') as fh:
-        ttl_data = fh.read()
-        rel_id = filepath.parent / filepath.stem
-        if filepath.stem == 'wis':
-            rel_id = filepath.stem
-        url = f'{url}/{rel_id}'
-        public_id = f'{PUBLIC_ID_PREFIX}/{rel_id}'
+    source = source or DirectorySource()
+
+    ttl_data = source.read(filepath)
+    rel_id = entry_id(filepath)
+    url = f'{url}/{rel_id}'
+    public_id = f'{PUBLIC_ID_PREFIX}/{rel_id}'
 
-        print(f'Processing {filepath}')
+    log(f'Processing {filepath}')
 
-        result = check_file(session, url, public_id, ttl_data, verbose)
+    if manifest is not None:
+        digest = canonical_digest(ttl_data, public_id)
+        if manifest.is_current(rel_id, digest):
+            log('  Unchanged since last upload, nothing to do.')
+            return True
+
+    try:
+        if snapshot is not None:
+            result = check_snapshot(snapshot, url, public_id, ttl_data,
+                                    verbose)
+        else:
+            result = check_file(session, url, public_id, ttl_data, verbose)
         if result == CheckResult.CHANGED:
-            print('  Changed entry, will upload.')
-            put(session, url, ttl_data, dry_run, verbose, status)
+            log('  Changed entry, will upload.')
+            success = put(session, url, ttl_data, dry_run, verbose, status)
         elif result == CheckResult.NEW:
-            print('  New entry, will upload.')
             url = '/'.join(url.split('/')[:-1])
-            post(session, url, ttl_data, dry_run, verbose, status)
+            success = False
+            if members:
+                log(f'  New register, will upload with {len(members)} entries.')  # noqa
+                success = post_batch(session, url, ttl_data, public_id,
+                                     members, dry_run, verbose, status,
+                                     manifest, batched, source)
+            if not success:
+                log('  New entry, will upload.')
+                success = post(session, url, ttl_data, dry_run, verbose,
+                               status)
         else:
-            print("  Unchanged entry, nothing to do.")
+            log("  Unchanged entry, nothing to do.")
+            success = True
+    except (ValueError, requests.RequestException) as err:
+        # the entry (and its descendants) fail, not the whole upload
+        log(f'  Failed: {err}', file=sys.stderr)
+        return False
+
+    if success and manifest is not None and \
+            (result == CheckResult.EQUAL or not dry_run):
+        manifest.record(rel_id, digest)
+
+    return success
+
+
+def post_batch(session: requests.Session, url: str, ttl: str,
+               public_id: str, members: list[Path], dry_run: bool,
+               verbose: bool, status: str, manifest: UploadManifest = None,
+               batched: set = None, source: DirectorySource = None) -> bool:
+    """
+    Registers a new register with its entries in a single request
+
+    :param session: API session
+    :param url: URL of the parent register
+    :param ttl: TTL representation of the register
+    :param public_id: Id of the register.
+    :param members: TTL files of the entries of the register
+    :param dry_run: whether to run as a dry run (simulates request only)
+    :param verbose: whether to provide verbose output
+    :param status: publication status (experimental, stable)
+    :param manifest: optional manifest of the entries confirmed on the
+                     registry, updated with the entries
+    :param batched: `set` collecting the entries registered
+    :param source: optional source of the TTL files (directory or archive)
+
+    :returns: `bool` of whether the request succeeded; if not, the
+              register and its entries are to be uploaded one by one
+    """
+
+    source = source or DirectorySource()
+
+    member_ttls = []
+    for member in members:
+        member_id = f'{PUBLIC_ID_PREFIX}/{entry_id(member)}'
+        member_ttls.append((source.read(member), member_id))
+
+    payload = build_batch_payload(ttl, public_id, member_ttls)
+    if not post(session, url, payload, dry_run, verbose, status, True):
+        log('  Batch upload refused, uploading entries one by one.')
+        return False
+
+    for member, (member_ttl, member_id) in zip(members, member_ttls):
+        if batched is not None:
+            batched.add(member)
+        if manifest is not None and not dry_run:
+            manifest.record(entry_id(member),
+                            canonical_digest(member_ttl, member_id))
+
+    return True
+
 
-    return
+def build_upload_graph(directory: Path,
+                       source: DirectorySource = None) -> dict:
+    """
+    Builds the register/entry dependency graph of the TTL files in a
+    directory: the parent of `a/b/c.ttl` is the register `a/b.ttl`
+
+    :param directory: `pathlib.Path` of the directory with TTL files
+    :param source: optional source of the TTL files (directory or archive)
+
+    :returns: `dict` of the TTL files depending on each TTL file; files
+              whose parent register is not part of the directory are
+              listed under `None`
+    """
+
+    filepaths = (source or DirectorySource()).files(directory)
+    registers = set(filepaths)
+    graph = {}
+
+    for filepath in filepaths:
+        parent = filepath.parent.parent / f'{filepath.parent.name}.ttl'
+        if parent not in registers:
+            parent = None
+        graph.setdefault(parent, []).append(filepath)
+
+    return graph
+
+
+def upload(session: requests.Session, url: str, directory: Path,
+           dry_run: bool, verbose: bool, status: str,
+           workers: int = 1, snapshot: RegistrySnapshot = None,
+           manifest: UploadManifest = None, batch: bool = False,
+           source: DirectorySource = None) -> int:
+    """
+    Uploads all TTL files of a directory to the registry
+
+    Siblings are processed concurrently, but an entry is only processed
+    once its parent register has been processed successfully.  In batch
+    mode, a new register is registered along with its entries which are
+    not registers themselves, in a single request.
+
+    :param session: API session
+    :param url: base URL of the registry
+    :param directory: `pathlib.Path` of the directory with TTL files
+    :param dry_run: whether to run as a dry run (simulates request only)
+    :param verbose: whether to provide verbose output
+    :param status: publication status (experimental, stable)
+    :param workers: number of concurrent uploads
+    :param snapshot: optional snapshot of the registers to compare with
+    :param manifest: optional manifest of the entries confirmed on the
+                     registry
+    :param batch: whether to register new registers with their entries
+    :param source: optional source of the TTL files (directory or archive)
+
+    :returns: `int` of TTL files which failed or were skipped
+    """
+
+    graph = build_upload_graph(directory, source)
+    batched = set()
+    failed = 0
+
+    def count_descendants(filepath: Path) -> int:
+        children = graph.get(filepath, [])
+        return len(children) + sum(count_descendants(c) for c in children)
+
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit(filepath: Path) -> None:
+            members = None
+            if batch:
+                members = [child for child in graph.get(filepath, [])
+                           if child not in graph]
+            # the messages of each entry are printed at once, once done
+            future = executor.submit(collect_messages, process_file,
+                                     session, url, filepath, dry_run,
+                                     verbose, status, snapshot, manifest,
+                                     members, batched, source)
+            pending[future] = filepath
+
+        for filepath in graph.get(None, []):
+            submit(filepath)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                filepath = pending.pop(future)
+                success, messages = future.result()
+                print_messages(messages)
+                if success:
+                    for child in graph.get(filepath, []):
+                        if child not in batched:
+                            submit(child)
+                else:
+                    skipped = count_descendants(filepath)
+                    if skipped:
+                        print(f'Skipping {skipped} entries below {filepath}')
+                    failed += 1 + skipped
+
+    return failed
 
 
 if __name__ == '__main__':
@@ -259,6 +763,10 @@ if __name__ == '__main__':
     parser.add_argument('mode', help='Mode: test or prod')
     parser.add_argument('directory',
                         help='Name of the directory with TTL files to upload')
+    parser.add_argument(
+        '-a', '--archive',
+        help='Zip or tar archive written by codelists2ttl.py --archive to read the directory from'  # noqa
+    )
     parser.add_argument(
         '-n',
         '--dry-run',
@@ -269,12 +777,70 @@ if __name__ == '__main__':
                         action='store_true', help='Print more details')
     parser.add_argument('-s', '--status', default='experimental',
                         help='Status (experimental, stable)')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help='Number of concurrent uploads')
+    parser.add_argument(
+        '--snapshot',
+        action='store_true',
+        help='Compare with register contents fetched once per register'
+    )
+    parser.add_argument(
+        '-m', '--manifest',
+        help='Manifest file of the entries confirmed on the registry, used to skip unchanged entries'  # noqa
+    )
+    parser.add_argument(
+        '-b', '--batch',
+        action='store_true',
+        help='Register new registers along with their entries in one request (batch-managed)'  # noqa
+    )
+    parser.add_argument(
+        '-u', '--base-url',
+        help='Base URL of the registry API, instead of the one of the mode (e.g. a local fake_registry.py)'  # noqa
+    )
+    parser.add_argument(
+        '--pool-size', type=int,
+        help='Number of connections kept alive (default: number of workers, at least 10)'  # noqa
+    )
+    parser.add_argument(
+        '--retries', type=int, default=http_transport.RETRIES,
+        help='Maximum number of retries of a throttled or failed request'
+    )
+    parser.add_argument(
+        '--rate', type=float, default=http_transport.RATE,
+        help='Initial number of requests per second, adapted to the throttling of the registry (0 for no limit)'  # noqa
+    )
+    parser.add_argument(
+        '--max-rate', type=float,
+        help='Maximum number of requests per second'
+    )
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='Compare all entries with the registry, even if unchanged according to the manifest'  # noqa
+    )
+    parser.add_argument(
+        '--report', type=Path,
+        help='File to write a JSON report of timings, counters and HTTP latencies to'  # noqa
+    )
+    parser.add_argument(
+        '--profile', type=Path,
+        help='File to write a cProfile dump of the entry comparisons to'
+    )
 
     args = parser.parse_args()
 
+    if args.profile is not None:
+        instrumentation.recorder.enable_profiling()
+
     REGISTRY = TEST_REGISTRY
 
-    if not Path(args.directory).is_dir():
+    source = None
+    if args.archive is not None:
+        source = ArchiveSource(Path(args.archive))
+        if not source.files(Path(args.directory)):
+            raise ValueError(f'No TTL files below {args.directory} in '
+                             f'{args.archive}.')
+    elif not Path(args.directory).is_dir():
         raise ValueError(f'Directory {args.directory} does not exists.')
     if args.mode not in ['test', 'prod']:
         raise ValueError('Mode must be either "test" or "prod"')
@@ -282,16 +848,51 @@ if __name__ == '__main__':
         raise ValueError('Mode must be either "stable" or "experimental"')
     if args.mode == 'prod':
         REGISTRY = PROD_REGISTRY
+    if args.base_url is not None:
+        REGISTRY = args.base_url.rstrip('/')
 
     print(f'Running upload against {REGISTRY}')
 
-    session = authenticate(REGISTRY, args.user_id, args.password)
+    limiter = None
+    if args.rate:
+        limiter = http_transport.RateLimiter(args.rate,
+                                             max_rate=args.max_rate)
+    session = http_transport.RegistrySession(
+        args.pool_size or max(args.workers, http_transport.POOL_SIZE),
+        args.retries, limiter=limiter)
+
+    with instrumentation.phase('authenticate'):
+        session = authenticate(REGISTRY, args.user_id, args.password,
+                               session)
 
     # cleanup if needed
     # session.delete('https://ci.codes.wmo.int/wis')
 
-    for filename in Path(args.directory).rglob('*.ttl'):
-        process_file(session, REGISTRY, filename, args.dry_run,
-                     args.verbose, args.status)
+    snapshot = None
+    if args.snapshot:
+        snapshot = RegistrySnapshot(session, args.verbose)
+
+    manifest = None
+    if args.manifest is not None:
+        manifest = UploadManifest(Path(args.manifest), REGISTRY, args.verify)
+
+    try:
+        with instrumentation.phase('upload'):
+            failed = upload(session, REGISTRY, Path(args.directory),
+                            args.dry_run, args.verbose, args.status,
+                            args.workers, snapshot, manifest, args.batch,
+                            source)
+    finally:
+        if manifest is not None:
+            manifest.save()
+        if args.report is not None:
+            instrumentation.recorder.write_report(args.report,
+                                                  'upload_changes.py')
+        if args.profile is not None:
+            instrumentation.recorder.write_profile(args.profile)
+
+    if failed:
+        print(f'{failed} entries failed or were skipped', file=sys.stderr)
+        sys.exit(1)
 
     print('Done')